@@ -0,0 +1,54 @@
+import argparse
+import time
+import numpy as np
+from src.embedder import SECTION_NAMES
+from src.vector_index import VectorSnapshot, SEARCH_SNAPSHOT_DIR
+from src.ann import AnnIndexes, ANN_REFINE
+
+def ann_report():
+    parser = argparse.ArgumentParser(description="Measure ANN recall and latency against exact search on the snapshot.")
+    parser.add_argument("--section", choices=SECTION_NAMES, default="description")
+    parser.add_argument("--queries", type=int, default=200, help="Snapshot rows used as queries")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--refine", type=int, default=ANN_REFINE, help="Exact re-scoring factor (0 = PQ scores only)")
+    args = parser.parse_args()
+
+    # Run against a built snapshot (build_snapshot.py) while the API is stopped
+    snapshot = VectorSnapshot(SEARCH_SNAPSHOT_DIR).open()
+    ann = AnnIndexes(snapshot)
+    snapshot.listeners.append(ann)
+    ann.train_missing()
+    index = ann.get(args.section)
+    if index is None:
+        print(f"No ANN index for {args.section}: the snapshot needs more vectors (see ANN_MIN_TRAIN).")
+        snapshot.close()
+        return
+
+    column = snapshot.sections.index(args.section)
+    present = np.flatnonzero(snapshot.mask[:snapshot.count, column])
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(present, size=min(args.queries, len(present)), replace=False)
+    queries = np.asarray(snapshot.matrices[args.section][query_rows])
+
+    started = time.perf_counter()
+    truth = [{row for row, _ in snapshot.search(query, args.section, args.top_k)} for query in queries]
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    print(f"{args.section}: {len(index)} vectors, nlist={index.nlist}, m={index.m}, refine={args.refine}, {len(queries)} queries, k={args.top_k}\n")
+    print(f"{'nprobe':>8} {f'recall@{args.top_k}':>10} {'ms/query':>10}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_ms:>10.2f}")
+    for nprobe in args.nprobe:
+        started = time.perf_counter()
+        results = [ann.search(args.section, query, args.top_k, nprobe, args.refine) for query in queries]
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = np.mean([
+            len(expected & {row for row, _ in found}) / len(expected)
+            for expected, found in zip(truth, results)
+        ])
+        print(f"{nprobe:>8} {recall:>10.3f} {elapsed_ms:>10.2f}")
+
+    snapshot.close()
+
+if __name__ == "__main__":
+    ann_report()
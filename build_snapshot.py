@@ -0,0 +1,28 @@
+import asyncio
+from src import database
+from src.database import connect_to_mongo, close_mongo_connection, COLLECTION_NAME
+from src.vector_index import VectorSnapshot, SEARCH_SNAPSHOT_DIR, reset_snapshot, sync_snapshot
+from src.ann import AnnIndexes, ANN_ENABLED
+
+async def build_snapshot():
+    # Stop the API first: a running service keeps its own handle on the snapshot files
+    print(f"Rebuilding search snapshot in {SEARCH_SNAPSHOT_DIR}...")
+    await connect_to_mongo()
+    
+    try:
+        reset_snapshot(SEARCH_SNAPSHOT_DIR)
+        snapshot = VectorSnapshot(SEARCH_SNAPSHOT_DIR).open()
+        synced = await sync_snapshot(snapshot, database.db[COLLECTION_NAME])
+        if ANN_ENABLED:
+            # Saved next to the snapshot when it is closed
+            ann = AnnIndexes(snapshot)
+            snapshot.listeners.append(ann)
+            ann.train_missing()
+        snapshot.close()
+    finally:
+        await close_mongo_connection()
+    
+    print(f"\nSnapshot Complete! {synced} jobs indexed.")
+
+if __name__ == "__main__":
+    asyncio.run(build_snapshot())
@@ -3,6 +3,7 @@ import os
 import certifi
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from src.vector_codec import decode_section
 
 load_dotenv()
 
@@ -28,7 +29,8 @@ async def check_embeddings():
         has_vectors = False
         for section in ["title", "description", "required_skills"]:
             section_data = embs.get(section)
-            if isinstance(section_data, dict) and isinstance(section_data.get("vector"), list):
+            # Vectors may be stored as lists or packed BinData
+            if isinstance(section_data, dict) and decode_section(section_data) is not None:
                 has_vectors = True
                 break
         
@@ -0,0 +1,77 @@
+import argparse
+import csv
+import os
+import time
+import numpy as np
+from src.normalizer import normalize_job
+from src.embedder import load_model, gather_section_texts, get_model_id
+
+# Fallback sample used when no CSV is available
+SAMPLE_JOBS = [
+    {
+        "title": "Senior Backend Engineer",
+        "description": "We need an expert in Python, FastAPI, and Vector Databases to build scalable microservices.",
+        "skills_desc": "Python, MongoDB, Docker, Kubernetes"
+    },
+    {
+        "title": "Senior Machine Learning Engineer",
+        "description": "We are building safe AI systems. You will work on RLHF and language model training.",
+        "skills_desc": "Python, PyTorch, Kubernetes, Distributed Systems"
+    },
+    {
+        "title": "React Frontend Developer",
+        "description": "Building the next generation of TV UIs. Must have deep experience with React performance.",
+        "skills_desc": "JavaScript, TypeScript, React, CSS"
+    }
+]
+
+def load_texts(csv_file, limit):
+    rows = SAMPLE_JOBS
+    if csv_file and os.path.exists(csv_file):
+        with open(csv_file, mode='r', encoding='utf-8', errors='replace') as f:
+            rows = [row for _, row in zip(range(limit), csv.DictReader(f))]
+    else:
+        print("No CSV given, using built-in sample jobs.")
+
+    jobs = [normalize_job(row, f"sample-{i}").job_data for i, row in enumerate(rows)]
+    _, items = gather_section_texts(jobs)
+    return [text for _, text in items]
+
+def benchmark(model, texts, repeats):
+    # Warm-up pass so one-off graph/session setup is not measured
+    model.encode(texts[:8], normalize_embeddings=True)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        vectors = model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+    elapsed = time.perf_counter() - started
+    return vectors, len(texts) * repeats / elapsed
+
+def compare_backends():
+    parser = argparse.ArgumentParser(description="Compare ONNX Runtime embeddings against the PyTorch backend.")
+    parser.add_argument("--csv", help="CSV of raw jobs to take section texts from")
+    parser.add_argument("--limit", type=int, default=200, help="Rows to read from the CSV")
+    parser.add_argument("--quantization", default=os.getenv("ONNX_QUANTIZATION"), help="int8 config: avx2, avx512, avx512_vnni or arm64")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = load_texts(args.csv, args.limit)
+    print(f"Comparing on {len(texts)} section texts...\n")
+
+    reference, torch_rate = benchmark(load_model("torch"), texts, args.repeats)
+    candidate, onnx_rate = benchmark(load_model("onnx", args.quantization), texts, args.repeats)
+
+    # Both sides are L2-normalized, so the row-wise dot product is the cosine
+    cosine = np.sum(reference * candidate, axis=1)
+    drift = 1.0 - cosine
+
+    print(f"\n--- Parity: {get_model_id('onnx', args.quantization)} vs {get_model_id('torch')} ---")
+    print(f"Mean cosine similarity: {cosine.mean():.6f}")
+    print(f"Min cosine similarity:  {cosine.min():.6f}")
+    print(f"Max cosine drift:       {drift.max():.6f}")
+
+    print("\n--- Throughput (texts/sec) ---")
+    print(f"torch: {torch_rate:.1f}")
+    print(f"onnx:  {onnx_rate:.1f} ({onnx_rate / torch_rate:.2f}x)")
+
+if __name__ == "__main__":
+    compare_backends()
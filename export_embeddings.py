@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import os
+import shutil
+import time
+from src import database
+from src.database import connect_to_mongo, close_mongo_connection, COLLECTION_NAME
+from src.export import export_to_directory, parse_sections, EXPORT_FORMATS, EXPORT_BATCH_SIZE, EXPORT_SHARD_ROWS, MANIFEST_NAME
+
+async def export(directory, fmt, sections, shard_rows, batch_size, restart):
+    if restart and os.path.exists(directory):
+        shutil.rmtree(directory)
+
+    await connect_to_mongo()
+    started = time.perf_counter()
+
+    def on_shard(manifest):
+        elapsed = time.perf_counter() - started
+        print(f"Wrote shard {manifest.shard_count - 1}: {manifest.rows} jobs exported ({elapsed:.0f}s, last _id: {manifest.last_id})")
+
+    try:
+        manifest = await export_to_directory(
+            database.db[COLLECTION_NAME], directory, fmt, sections, shard_rows, batch_size, on_shard
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        await close_mongo_connection()
+
+    print(f"\nExport Complete! {manifest.rows} jobs in {manifest.shard_count} shards under {directory} (see {MANIFEST_NAME}).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored embedding vectors to sharded float32 .npy or Arrow IPC files.")
+    parser.add_argument("directory", nargs="?", default="export", help="Output directory (an interrupted export in it is resumed)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="npy", help="Shard file format")
+    parser.add_argument("--sections", help="Comma-separated sections to export (default: all)")
+    parser.add_argument("--shard-rows", type=int, default=EXPORT_SHARD_ROWS, help="Jobs per shard")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Documents fetched per cursor batch")
+    parser.add_argument("--restart", action="store_true", help="Delete the output directory and export from the first job")
+    args = parser.parse_args()
+
+    try:
+        sections = parse_sections(args.sections)
+    except ValueError as e:
+        parser.error(str(e))
+    asyncio.run(export(args.directory, args.format, sections, args.shard_rows, args.batch_size, args.restart))
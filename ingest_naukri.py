@@ -1,80 +1,283 @@
+import argparse
 import asyncio
 import csv
-import sys
+import json
 import os
-from src.normalizer import normalize_job
-from src.embedder import generate_embeddings, get_metadata
-from src.schemas import JobOutput
+import time
+from src.normalizer import normalize_jobs
+from src.embedder import generate_embeddings_batch, get_metadata, get_skill_vocabulary
+from src.inference import run_inference, shutdown_inference
+from src.job_vectors import EmbeddedJob
+from src.dedup import embed_deduplicated, fingerprint, get_duplicate_index
 from src.database import connect_to_mongo, save_job, close_mongo_connection
+from src.encoder_pool import start_encoder_pool, stop_encoder_pool
 
 CSV_FILE = "naukri_com-job_sample.csv"
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+# Batches encoded / saved at the same time
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+# Seconds between progress reports
+REPORT_INTERVAL_S = 10
 
-async def ingest():
-    if not os.path.exists(CSV_FILE):
-        print(f"Error: File '{CSV_FILE}' not found.")
-        print(f"Please download the dataset from Kaggle and place it in: {os.getcwd()}/{CSV_FILE}")
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.errors = 0
+
+    def rate(self, elapsed):
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+class Checkpoint:
+    """
+    Row offset up to which every CSV row has been saved (or skipped).
+
+    Batches finish out of order when several are in flight, so the offset
+    only advances over a contiguous run of finished batches.
+    """
+
+    def __init__(self, path, csv_file):
+        self.path = path
+        self.csv_file = csv_file
+        self.row = 0
+        self._finished = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            if state.get("csv") == os.path.abspath(self.csv_file):
+                self.row = state["row"]
+        return self.row
+
+    def finish(self, first_row, last_row):
+        # Rows are numbered from 1; the batch covers first_row..last_row
+        self._finished[first_row] = last_row
+        advanced = False
+        while self.row + 1 in self._finished:
+            self.row = self._finished.pop(self.row + 1)
+            advanced = True
+        if advanced:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"csv": os.path.abspath(self.csv_file), "row": self.row}, f)
+            os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+async def read_rows(csv_file, start_row, limit, out_queue, stats):
+    """
+    Stage 1: parse the CSV in a thread, BATCH_SIZE rows at a time, after
+    skipping the rows a previous run already checkpointed.
+    """
+    f = open(csv_file, mode='r', encoding='utf-8', errors='replace')
+    reader = csv.DictReader(f)
+    row_number = 0
+
+    def next_chunk():
+        nonlocal row_number
+        chunk = []
+        for row in reader:
+            row_number += 1
+            if row_number <= start_row:
+                continue
+            chunk.append((row_number, row))
+            if len(chunk) >= BATCH_SIZE or (limit and row_number >= start_row + limit):
+                break
+        return chunk
+
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next_chunk)
+            if not chunk:
+                break
+            stats.rows += len(chunk)
+            await out_queue.put(chunk)
+            if limit and row_number >= start_row + limit:
+                print(f"Reached limit of {limit} rows. Stopping ingestion.")
+                break
+    finally:
+        f.close()
+        await out_queue.put(None)
+
+async def normalize_rows(in_queue, out_queue, stats, workers):
+    """
+    Stage 2: normalize each chunk and drop rows without a title.
+    """
+    while True:
+        chunk = await in_queue.get()
+        if chunk is None:
+            break
+        batch = []
+        # normalize_jobs prefers the CSV's ID column over these placeholders
+        results = normalize_jobs([row for _, row in chunk], [f"naukri-{row_number}" for row_number, _ in chunk])
+        for (row_number, _), canonical_job in zip(chunk, results):
+            if isinstance(canonical_job, Exception):
+                print(f"Error processing row {row_number}: {canonical_job}")
+                stats.errors += 1
+                continue
+            # Skip if no title (junk data)
+            if not canonical_job.job_data.title:
+                stats.errors += 1
+                continue
+            batch.append(canonical_job)
+        # Near-duplicate signatures are computed here, off the encode stage
+        fingerprints = [fingerprint(job.job_data) for job in batch] if get_duplicate_index() else None
+        stats.rows += len(batch)
+        await out_queue.put((chunk[0][0], chunk[-1][0], batch, fingerprints))
+
+    for _ in range(workers):
+        await out_queue.put(None)
+
+async def encode_batches(in_queue, out_queue, stats):
+    """
+    Stage 3: embed every section of a batch in one encode call, on the
+    inference threads (or the encoder pool) so batches overlap.
+    """
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            break
+        first_row, last_row, batch, fingerprints = item
+        embeddings = []
+        failed = False
+        if batch:
+            try:
+                # Near-duplicates of already encoded jobs reuse their vectors (DEDUP_ENABLED)
+                embeddings = await embed_deduplicated(
+                    batch,
+                    lambda jobs: run_inference(generate_embeddings_batch, jobs),
+                    fingerprints
+                )
+            except Exception as e:
+                print(f"Error embedding batch of rows {first_row}-{last_row}: {e}")
+                stats.errors += len(batch)
+                batch = []
+                failed = True
+        stats.rows += len(batch)
+        await out_queue.put((first_row, last_row, batch, embeddings, failed))
+
+    # One sentinel per encoder, matched by one save worker each
+    await out_queue.put(None)
+
+async def save_batches(in_queue, stats, checkpoint):
+    """
+    Stage 4: upsert a batch; the concurrent saves are committed together by
+    the write buffer. The checkpoint advances once a batch is stored; a
+    batch that failed to embed or save holds it back, so the next run
+    retries from there.
+    """
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            break
+        first_row, last_row, batch, batch_embeddings, failed = item
+
+        async def save(canonical_job, embeddings, duplicate_of):
+            try:
+                await save_job(EmbeddedJob(
+                    job_id=canonical_job.job_id,
+                    cleaned_job=canonical_job.job_data,
+                    embeddings=embeddings,
+                    metadata=get_metadata(embeddings, duplicate_of)
+                ))
+                stats.rows += 1
+                return True
+            except Exception as e:
+                print(f"Error saving job {canonical_job.job_id}: {e}")
+                stats.errors += 1
+                return False
+
+        saved = await asyncio.gather(*[
+            save(job, embeddings, duplicate_of)
+            for job, (embeddings, duplicate_of) in zip(batch, batch_embeddings)
+        ])
+        if failed or not all(saved):
+            print(f"Rows {first_row}-{last_row} were not all stored; the checkpoint will not advance past row {first_row - 1}")
+            continue
+        checkpoint.finish(first_row, last_row)
+
+async def report(stages, queues, started, checkpoint):
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL_S)
+        print_report(stages, queues, started, checkpoint)
+
+def print_report(stages, queues, started, checkpoint):
+    elapsed = time.perf_counter() - started
+    rates = ", ".join(f"{stage.name} {stage.rate(elapsed):.1f}/s" for stage in stages)
+    depths = "/".join(str(queue.qsize()) for queue in queues)
+    print(f"[{elapsed:.0f}s] {rates} | queued {depths} | checkpoint row {checkpoint.row}")
+
+async def ingest(csv_file, limit, concurrency, restart):
+    if not os.path.exists(csv_file):
+        print(f"Error: File '{csv_file}' not found.")
+        print(f"Please download the dataset from Kaggle and place it in: {os.path.abspath(csv_file)}")
         return
 
-    print(f"Starting ingestion from {CSV_FILE}...")
-    
+    checkpoint = Checkpoint(f"{csv_file}.checkpoint", csv_file)
+    if restart:
+        checkpoint.clear()
+    start_row = checkpoint.load()
+    if start_row:
+        print(f"Resuming {csv_file} after row {start_row} (pass --restart to start over)...")
+    else:
+        print(f"Starting ingestion from {csv_file}...")
+
     # Connect to DB
     await connect_to_mongo()
-    
-    count = 0
-    success = 0
-    
+
+    # Shard encoding across ENCODER_PROCESSES worker processes if configured
+    start_encoder_pool()
+
+    # Bounded queues give backpressure: a slow stage stalls the ones before it
+    chunks = asyncio.Queue(maxsize=concurrency * 2)
+    normalized = asyncio.Queue(maxsize=concurrency * 2)
+    encoded = asyncio.Queue(maxsize=concurrency * 2)
+    stages = [StageStats("read"), StageStats("normalize"), StageStats("encode"), StageStats("save")]
+    queues = [chunks, normalized, encoded]
+
+    started = time.perf_counter()
+    reporter = asyncio.create_task(report(stages, queues, started, checkpoint))
+    tasks = [
+        asyncio.create_task(read_rows(csv_file, start_row, limit, chunks, stages[0])),
+        asyncio.create_task(normalize_rows(chunks, normalized, stages[1], concurrency)),
+        *[asyncio.create_task(encode_batches(normalized, encoded, stages[2])) for _ in range(concurrency)],
+        *[asyncio.create_task(save_batches(encoded, stages[3], checkpoint)) for _ in range(concurrency)],
+    ]
     try:
-        with open(CSV_FILE, mode='r', encoding='utf-8', errors='replace') as f:
-            reader = csv.DictReader(f)
-            
-            for row in reader:
-                if success >= 2000:
-                    print("Reached limit of 2000 jobs. Stopping ingestion.")
-                    break
-                
-                count += 1
-                try:
-                    # Use unique ID from CSV if available (handled in normalize_job via 'Uniq Id')
-                    # We pass a placeholder UUID, but normalize_job will overwrite it if 'Uniq Id' exists
-                    temp_id = f"naukri-{count}"
-                    
-                    # 1. Normalize
-                    canonical_job = normalize_job(row, temp_id)
-                    
-                    # Skip if no title (junk data)
-                    if not canonical_job.job_data.title:
-                        print(f"Skipping row {count}: No Job Title found.")
-                        continue
-                        
-                    # 2. Embed
-                    embeddings = generate_embeddings(canonical_job.job_data)
-                    
-                    # 3. Metadata
-                    metadata = get_metadata(embeddings)
-                    
-                    job_output = JobOutput(
-                        job_id=canonical_job.job_id,
-                        cleaned_job=canonical_job.job_data,
-                        embeddings=embeddings,
-                        metadata=metadata
-                    )
-                    
-                    # 4. Save
-                    await save_job(job_output)
-                    success += 1
-                    
-                    if count % 10 == 0:
-                        print(f"Processed {count} jobs... (Saved: {success})")
-                        
-                except Exception as e:
-                    print(f"Error processing row {count}: {e}")
-                    
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
     finally:
+        # A failed (or interrupted) stage stops the others before the pool and DB they use are closed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        reporter.cancel()
+        if get_skill_vocabulary() is not None:
+            get_skill_vocabulary().close()
+        stop_encoder_pool()
+        shutdown_inference()
         await close_mongo_connection()
 
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+
     print(f"\nIngestion Complete!")
-    print(f"Total processed: {count}")
-    print(f"Successfully saved: {success}")
+    print_report(stages, queues, started, checkpoint)
+    print(f"Rows read: {stages[0].rows} (skipped: {stages[1].errors})")
+    print(f"Successfully saved: {stages[3].rows} (failed: {stages[2].errors + stages[3].errors})")
+    if get_duplicate_index():
+        dedup = get_duplicate_index().stats()
+        print(f"Near-duplicates: {dedup['duplicates']} reused embeddings, ~{dedup['encode_s_saved']:.1f}s of encoding saved")
 
 if __name__ == "__main__":
-    asyncio.run(ingest())
+    parser = argparse.ArgumentParser(description="Stream a Naukri/LinkedIn CSV dump into MongoDB with embeddings.")
+    parser.add_argument("csv_file", nargs="?", default=CSV_FILE, help="CSV file to ingest")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after reading this many CSV rows past the checkpoint, including rows skipped for having no title (0 = whole file)")
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY, help="Batches encoded and saved at the same time")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first row")
+    args = parser.parse_args()
+
+    asyncio.run(ingest(args.csv_file, args.limit, args.concurrency, args.restart))
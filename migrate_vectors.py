@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+from bson import ObjectId
+from pymongo import UpdateOne
+from src.database import connect_to_mongo, close_mongo_connection, COLLECTION_NAME
+from src import database
+from src.vector_codec import encode_embeddings_document, VECTOR_FORMATS, VECTOR_STORAGE_FORMAT, STORE_SECTION_TEXT
+
+def needs_migration(embeddings, fmt, store_text):
+    for section in embeddings.values():
+        section = section or {}
+        if section.get("vector") is not None and section.get("vector_format", "list") != fmt:
+            return True
+        if not store_text and "text" in section:
+            return True
+    return False
+
+async def migrate(fmt, store_text, batch_size, after):
+    await connect_to_mongo()
+    collection = database.db[COLLECTION_NAME]
+
+    scanned = 0
+    migrated = 0
+    changed = 0
+    try:
+        while True:
+            query = {"embeddings": {"$exists": True}}
+            if after is not None:
+                query["_id"] = {"$gt": after}
+            cursor = collection.find(query, {"embeddings": 1, "embedded_at": 1}).sort("_id", 1).limit(batch_size)
+            docs = await cursor.to_list(length=batch_size)
+            if not docs:
+                break
+
+            # Matching the embedded_at that was read skips jobs re-embedded (by the
+            # watcher or /process) since, instead of overwriting their new vectors
+            operations = [
+                UpdateOne(
+                    {"_id": doc["_id"], "embedded_at": doc.get("embedded_at")},
+                    {"$set": {"embeddings": encode_embeddings_document(doc["embeddings"], fmt, store_text)}}
+                )
+                for doc in docs
+                if needs_migration(doc["embeddings"], fmt, store_text)
+            ]
+            if operations:
+                result = await collection.bulk_write(operations, ordered=False)
+                migrated += result.matched_count
+                changed += len(operations) - result.matched_count
+
+            scanned += len(docs)
+            after = docs[-1]["_id"]
+            # Pass the last _id as --after to resume an interrupted migration
+            print(f"Scanned {scanned} jobs, migrated {migrated}, skipped {changed} re-embedded meanwhile (last _id: {after})")
+    finally:
+        await close_mongo_connection()
+
+    print(f"\nMigration Complete! {migrated} of {scanned} jobs rewritten as '{fmt}' ({changed} re-embedded during the migration were left as they are).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rewrite stored embedding vectors in another storage format.")
+    parser.add_argument("--format", choices=VECTOR_FORMATS, default=VECTOR_STORAGE_FORMAT, help="Target vector storage format")
+    parser.add_argument("--drop-text", action="store_true", default=not STORE_SECTION_TEXT, help="Remove section text stored next to vectors")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--after", type=ObjectId, help="Resume after this _id")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.format, not args.drop_text, args.batch_size, args.after))
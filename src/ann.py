@@ -0,0 +1,387 @@
+import os
+import queue
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Build IVF-PQ indexes over the search snapshot for approximate /search
+ANN_ENABLED = os.getenv("ANN_ENABLED", "1") == "1"
+# Coarse k-means partitions (capped at corpus_size / 39 for small corpora)
+ANN_NLIST = int(os.getenv("ANN_NLIST", "1024"))
+# Product-quantizer subspaces; each residual is stored as this many bytes
+ANN_M = int(os.getenv("ANN_M", "48"))
+# Partitions scanned per query unless the request overrides it
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+# Jobs needed in the snapshot before an index is trained
+ANN_MIN_TRAIN = int(os.getenv("ANN_MIN_TRAIN", "10000"))
+# Vectors sampled to train the coarse and PQ codebooks
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "100000"))
+# PQ candidates per requested hit that are re-scored exactly (0 disables)
+ANN_REFINE = int(os.getenv("ANN_REFINE", "8"))
+# Minimum seconds between saves of changed indexes (they are always saved on close)
+ANN_SAVE_INTERVAL_S = float(os.getenv("ANN_SAVE_INTERVAL_S", "300"))
+
+PQ_CENTROIDS = 256
+
+def nearest_centroids(x: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """
+    Index of the nearest centroid (L2) for every row of x, in chunks to
+    bound the size of the distance matrix.
+    """
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assign = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        block = x[start:start + chunk]
+        distances = centroid_norms[None, :] - 2 * block @ centroids.T
+        assign[start:start + chunk] = distances.argmin(axis=1)
+    return assign
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Plain Lloyd's k-means in NumPy. Empty clusters are re-seeded with
+    random points so every centroid stays in use.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = nearest_centroids(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+
+    return centroids
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product-quantized residuals.
+
+    Vectors are assigned to the nearest of `nlist` coarse centroids; the
+    residual to that centroid is split into `m` subvectors, each stored as
+    the uint8 id of its nearest PQ centroid. A query scans the `nprobe`
+    closest partitions and scores codes with per-partition lookup tables.
+    Rows are the search snapshot's row numbers, so updates replace the
+    row's previous entry.
+    """
+
+    def __init__(self, dim: int, nlist: int = ANN_NLIST, m: int = ANN_M):
+        if dim % m != 0:
+            raise ValueError(f"ANN_M={m} must divide the vector dimension {dim}")
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.sub_dim = dim // m
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self.list_rows: List[np.ndarray] = []
+        self.list_codes: List[np.ndarray] = []
+        self.row_list: Dict[int, int] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self):
+        return len(self.row_list)
+
+    def train(self, sample: np.ndarray):
+        sample = np.asarray(sample, dtype=np.float32)
+        nlist = max(1, min(self.nlist, len(sample) // 39))
+        centroids = kmeans(sample, nlist)
+
+        residuals = sample - centroids[nearest_centroids(sample, centroids)]
+        pq_sample = residuals[:65536]
+        codebooks = np.stack([
+            kmeans(pq_sample[:, j * self.sub_dim:(j + 1) * self.sub_dim], min(PQ_CENTROIDS, len(pq_sample)), iterations=15, seed=j)
+            for j in range(self.m)
+        ])
+
+        with self._lock:
+            self.nlist = nlist
+            self.centroids = centroids
+            self.codebooks = codebooks
+            self.list_rows = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+            self.list_codes = [np.empty((0, self.m), dtype=np.uint8) for _ in range(nlist)]
+            self.row_list = {}
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        lists = nearest_centroids(vectors, self.centroids)
+        residuals = vectors - self.centroids[lists]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = nearest_centroids(residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim], self.codebooks[j])
+        return lists, codes
+
+    def _update(self, removed: np.ndarray, added: np.ndarray, lists: np.ndarray, codes: np.ndarray):
+        """
+        Drops the `removed` rows from their lists, then appends each `added`
+        row to its list with its codes. Only the ANN maintenance thread
+        changes the lists, so the new arrays are built without the lock and
+        swapped in under it; searches keep scanning the arrays they hold.
+        """
+        changed = {self.row_list.get(int(row)) for row in removed} - {None}
+        changed |= set(np.unique(lists).tolist())
+        new_rows = {}
+        new_codes = {}
+        for list_no in changed:
+            keep = ~np.isin(self.list_rows[list_no], removed)
+            members = lists == list_no
+            new_rows[list_no] = np.concatenate([self.list_rows[list_no][keep], added[members]])
+            new_codes[list_no] = np.concatenate([self.list_codes[list_no][keep], codes[members]])
+
+        with self._lock:
+            for list_no in changed:
+                self.list_rows[list_no] = new_rows[list_no]
+                self.list_codes[list_no] = new_codes[list_no]
+            for row in removed:
+                self.row_list.pop(int(row), None)
+            for row, list_no in zip(added, lists):
+                self.row_list[int(row)] = int(list_no)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        if not self.is_trained or len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # A row written twice in one batch keeps its last vector
+        _, last = np.unique(rows[::-1], return_index=True)
+        keep = np.sort(len(rows) - 1 - last)
+        rows, vectors = rows[keep], vectors[keep]
+        lists, codes = self._encode(vectors)
+        self._update(rows, rows, lists, codes)
+
+    def remove(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.is_trained and len(rows):
+            self._update(rows, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, self.m), dtype=np.uint8))
+
+    def search(self, query: np.ndarray, top_k: int = 10, nprobe: int = ANN_NPROBE) -> List[Tuple[int, float]]:
+        """
+        Approximate top-k for an L2-normalized query. Returns (row, score)
+        pairs with scores converted back to cosine similarity.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            coarse = ((self.centroids - query) ** 2).sum(axis=1)
+            nprobe = min(nprobe, self.nlist)
+            probe = np.argpartition(coarse, nprobe - 1)[:nprobe]
+            scanned = [(list_no, self.list_rows[list_no], self.list_codes[list_no]) for list_no in probe]
+
+        found_rows = []
+        found_distances = []
+        subspaces = np.arange(self.m)
+        for list_no, rows, codes in scanned:
+            if len(rows) == 0:
+                continue
+            residual = (query - self.centroids[list_no]).reshape(self.m, 1, self.sub_dim)
+            # (m, 256) squared distances from each query subvector to each PQ centroid
+            table = ((residual - self.codebooks) ** 2).sum(axis=2)
+            found_rows.append(rows)
+            found_distances.append(table[subspaces, codes].sum(axis=1))
+
+        if not found_rows:
+            return []
+
+        rows = np.concatenate(found_rows)
+        distances = np.concatenate(found_distances)
+        k = min(top_k, len(rows))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        # For unit vectors ||a - b||^2 = 2 - 2 cos(a, b)
+        return [(int(rows[i]), float(1 - distances[i] / 2)) for i in top]
+
+    def save(self, path: str):
+        # Lists are replaced, never changed in place, so a copy of the references is a consistent view
+        with self._lock:
+            list_rows = list(self.list_rows)
+            list_codes = list(self.list_codes)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            codebooks=self.codebooks,
+            sizes=np.array([len(rows) for rows in list_rows], dtype=np.int64),
+            rows=np.concatenate(list_rows) if list_rows else np.empty(0, dtype=np.int64),
+            codes=np.concatenate(list_codes) if list_codes else np.empty((0, self.m), dtype=np.uint8),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQIndex":
+        data = np.load(path)
+        centroids = data["centroids"]
+        codebooks = data["codebooks"]
+        index = cls(centroids.shape[1], nlist=len(centroids), m=len(codebooks))
+        index.centroids = centroids
+        index.codebooks = codebooks
+
+        offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+        rows = data["rows"]
+        codes = data["codes"]
+        index.list_rows = [rows[offsets[i]:offsets[i + 1]] for i in range(len(centroids))]
+        index.list_codes = [codes[offsets[i]:offsets[i + 1]] for i in range(len(centroids))]
+        index.row_list = {int(row): i for i, list_rows in enumerate(index.list_rows) for row in list_rows}
+        return index
+
+class AnnIndexes:
+    """
+    One IVF-PQ index per section, kept next to the search snapshot.
+
+    Registered as a snapshot listener: rows written to the snapshot are
+    queued, in write order, to a maintenance thread that encodes them into
+    the matching section index once it is trained, so snapshot writes never
+    wait on PQ encoding. Changed indexes are saved at most every
+    ANN_SAVE_INTERVAL_S (the API calls save() from a worker thread) and
+    when the snapshot is closed, so restarts load them instead of
+    retraining.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.indexes: Dict[str, IVFPQIndex] = {}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._tasks: "queue.Queue[Optional[Callable[[], None]]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="ann-maintenance", daemon=True)
+        self._worker.start()
+
+        for section in snapshot.sections:
+            path = self._path(section)
+            if os.path.exists(path):
+                self.indexes[section] = IVFPQIndex.load(path)
+                print(f"Loaded ANN index for {section} ({len(self.indexes[section])} vectors)")
+
+    def _path(self, section: str) -> str:
+        return os.path.join(self.snapshot.directory, f"ann_{section}.npz")
+
+    def get(self, section: str) -> Optional[IVFPQIndex]:
+        index = self.indexes.get(section)
+        return index if index is not None and index.is_trained else None
+
+    def search(self, section: str, query: np.ndarray, top_k: int = 10, nprobe: int = ANN_NPROBE, refine: int = ANN_REFINE) -> List[Tuple[int, float]]:
+        """
+        Approximate top-k for one section. PQ scores only shortlist
+        candidates; the best top_k * refine are re-scored exactly against
+        the snapshot's full-precision rows, which recovers most of the
+        recall lost to quantization.
+        """
+        index = self.indexes[section]
+        if refine <= 0:
+            return index.search(query, top_k, nprobe)
+
+        candidates = index.search(query, top_k * refine, nprobe)
+        if not candidates:
+            return []
+        rows = np.array([row for row, _ in candidates])
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self.snapshot._lock:
+            scores = np.asarray(self.snapshot.matrices[section][rows]) @ query
+        top = np.argsort(-scores)[:top_k]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            try:
+                task()
+            except Exception as e:
+                print(f"⚠️ [Search] ANN index update failed: {e}")
+
+    def train_missing(self):
+        """
+        Trains an index for every section that has none yet, from a random
+        sample of the snapshot, then adds every row that has the section.
+        """
+        for column, section in enumerate(self.snapshot.sections):
+            if section in self.indexes:
+                continue
+            with self.snapshot._lock:
+                count = self.snapshot.count
+                present = np.flatnonzero(self.snapshot.mask[:count, column])
+            if len(present) < ANN_MIN_TRAIN:
+                continue
+
+            started = time.perf_counter()
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(present, size=min(ANN_TRAIN_SAMPLE, len(present)), replace=False))
+            index = IVFPQIndex(self.snapshot.dim)
+            index.train(np.asarray(self.snapshot.matrices[section][sample_rows]))
+
+            # From here on, new snapshot writes reach the index through on_upsert.
+            # The existing rows are loaded by tasks queued behind every earlier
+            # write, and each reads its rows when it runs, so a row updated or
+            # removed meanwhile ends up with its latest vector
+            loaded = threading.Event()
+            with self.snapshot._lock:
+                self.indexes[section] = index
+                present = np.flatnonzero(self.snapshot.mask[:self.snapshot.count, column])
+                for start in range(0, len(present), 8192):
+                    self._tasks.put(partial(self._load_rows, index, column, present[start:start + 8192]))
+                self._tasks.put(loaded.set)
+            loaded.wait()
+
+            self._dirty = True
+            print(f"[Search] Trained ANN index for {section}: {len(index)} vectors, nlist={index.nlist} in {time.perf_counter() - started:.1f}s")
+
+    def _load_rows(self, index: IVFPQIndex, column: int, rows: np.ndarray):
+        # The snapshot lock is held only to copy the rows; encoding runs without it
+        with self.snapshot._lock:
+            rows = rows[self.snapshot.mask[rows, column] == 1]
+            vectors = np.array(self.snapshot.matrices[self.snapshot.sections[column]][rows])
+        index.add(rows, vectors)
+
+    def on_upsert(self, rows: List[int], vectors: Dict[str, List[Optional[np.ndarray]]]):
+        # Called with the snapshot lock held, so tasks are queued in write order
+        if self.indexes:
+            self._tasks.put(partial(self._apply, rows, vectors))
+
+    def _apply(self, rows: List[int], vectors: Dict[str, List[Optional[np.ndarray]]]):
+        for section, index in list(self.indexes.items()):
+            if not index.is_trained:
+                continue
+            present = [(row, vector) for row, vector in zip(rows, vectors[section]) if vector is not None]
+            missing = [row for row, vector in zip(rows, vectors[section]) if vector is None]
+            if present:
+                index.add(np.array([row for row, _ in present]), np.stack([vector for _, vector in present]))
+            if missing:
+                index.remove(missing)
+            self._dirty = True
+
+    def save(self, force: bool = False):
+        if not self._dirty or (not force and time.monotonic() - self._saved_at < ANN_SAVE_INTERVAL_S):
+            return
+        # Cleared first so writes that land during the save mark it dirty again
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        for section, index in list(self.indexes.items()):
+            if index.is_trained:
+                index.save(self._path(section))
+
+    def on_close(self):
+        # Finish queued updates before the final save
+        self._tasks.put(None)
+        self._worker.join()
+        self.save(force=True)
+
+    def stats(self) -> dict:
+        return {
+            section: {"vectors": len(index), "nlist": index.nlist, "m": index.m}
+            for section, index in list(self.indexes.items())
+            if index.is_trained
+        }
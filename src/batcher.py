@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+from src.embedder import encode_sections, gather_section_texts, assemble_embeddings
+from src.schemas import JobData
+from src.job_vectors import JobEmbeddings
+from src.inference import run_inference, INFERENCE_WORKERS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum number of section texts coalesced into one encode call
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "64"))
+# Maximum time the first request of a batch waits for others to join
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+class MicroBatcher:
+    """
+    Coalesces section texts from concurrent requests into shared encode calls.
+
+    Each caller submits its texts and awaits a future. A single background
+    task drains the queue, groups whatever arrives within max_wait_ms (up to
+    max_batch_size texts), runs one encode on the inference executor and
+    resolves every future with its own slice of the result. At most
+    `workers` batches are encoded at once; while they are busy, new requests
+    keep accumulating into the next batch.
+    """
+
+    def __init__(self, encode_fn=encode_sections, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS, workers: int = INFERENCE_WORKERS):
+        self.encode_fn = encode_fn
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatches = set()
+
+        # Stats used to tune batch size against queue wait
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_seen_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._task = asyncio.create_task(self._run())
+            print(f"Micro-batcher started (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms}, workers={self.workers})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def encode(self, texts: List[Tuple[str, str]]) -> np.ndarray:
+        if self._task is None:
+            raise RuntimeError("Micro-batcher not started. Call start() first.")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future, time.perf_counter()))
+        return await future
+
+    async def embed_jobs(self, jobs: List[JobData]) -> List[JobEmbeddings]:
+        section_texts, pending_items = gather_section_texts(jobs)
+        vectors = await self.encode(pending_items) if pending_items else []
+        return assemble_embeddings(section_texts, vectors)
+
+    async def _collect(self):
+        first = await self._queue.get()
+        group = [first]
+        size = len(first[0])
+        deadline = first[2] + self.max_wait_ms / 1000
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            group.append(item)
+            size += len(item[0])
+
+        return group
+
+    async def _run(self):
+        while True:
+            # Wait for a free worker before sealing the next batch
+            await self._slots.acquire()
+            try:
+                group = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            dispatch = asyncio.create_task(self._dispatch(group))
+            self._dispatches.add(dispatch)
+            dispatch.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, group):
+        try:
+            started = time.perf_counter()
+            flat_items = [item for texts, _, _ in group for item in texts]
+
+            try:
+                vectors = await run_inference(self.encode_fn, flat_items)
+            except Exception as e:
+                for _, future, _ in group:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            offset = 0
+            for texts, future, enqueued in group:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+                wait_ms = (started - enqueued) * 1000
+                self.total_wait_ms += wait_ms
+                self.max_wait_seen_ms = max(self.max_wait_seen_ms, wait_ms)
+
+            self.batches += 1
+            self.requests += len(group)
+            self.texts += len(flat_items)
+            self.largest_batch = max(self.largest_batch, len(flat_items))
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "avg_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "avg_queue_wait_ms": self.total_wait_ms / self.requests if self.requests else 0.0,
+            "max_queue_wait_ms": self.max_wait_seen_ms,
+        }
+
+batcher = MicroBatcher()
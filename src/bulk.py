@@ -0,0 +1,265 @@
+import asyncio
+import codecs
+import json
+import os
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import orjson
+from dotenv import load_dotenv
+from starlette.responses import StreamingResponse
+from src.normalizer import normalize_jobs
+from src.embedder import get_metadata
+from src.batcher import batcher
+from src.database import save_job
+from src.dedup import embed_deduplicated
+from src.job_vectors import EmbeddedJob
+from src.responses import job_output_content
+
+load_dotenv()
+
+# Jobs from a /process/batch body embedded and saved together
+PROCESS_BATCH_SIZE = int(os.getenv("PROCESS_BATCH_SIZE", "64"))
+# Parsed batches buffered ahead of the encoder (bounds memory per request)
+PROCESS_BATCH_PREFETCH = int(os.getenv("PROCESS_BATCH_PREFETCH", "2"))
+# Largest single job accepted in a /process/batch body
+PROCESS_MAX_ITEM_BYTES = int(os.getenv("PROCESS_MAX_ITEM_BYTES", str(1024 * 1024)))
+
+# (index, payload dict or None, parse error or None)
+BulkItem = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+class BodyParser:
+    """
+    Incremental parser for a request body holding either NDJSON (one job
+    per line) or a single JSON array of jobs, decided by the first
+    non-whitespace byte. Yields one item per job as chunks arrive, so the
+    body is never held in memory as a whole.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._json = json.JSONDecoder()
+        # NDJSON is split and size-checked as bytes; an array is decoded to text for JSONDecoder
+        self._raw = b""
+        self._buffer = ""
+        self._mode: Optional[str] = None
+        self._array_done = False
+        self._index = 0
+        self._line = 0
+        self._skip_line = False
+
+    def _item(self, payload: Any = None, error: Optional[str] = None) -> BulkItem:
+        if error is None and not isinstance(payload, dict):
+            payload, error = None, "Each job must be a JSON object"
+        item = (self._index, payload, error)
+        self._index += 1
+        return item
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[BulkItem]:
+        if self._mode is None:
+            self._raw += chunk
+            stripped = self._raw.lstrip()
+            if not stripped:
+                return []
+            self._mode = "array" if stripped[:1] == b"[" else "ndjson"
+            chunk = stripped[1:] if self._mode == "array" else self._raw
+            self._raw = b""
+        if self._mode == "array":
+            self._buffer += self._decoder.decode(chunk, final)
+            return self._feed_array(final)
+        self._raw += chunk
+        return self._feed_lines(final)
+
+    def _feed_lines(self, final: bool) -> List[BulkItem]:
+        # A newline byte never occurs inside a multi-byte UTF-8 character
+        lines = self._raw.split(b"\n")
+        self._raw = b"" if final else lines.pop()
+        items = []
+        for line in lines:
+            if self._skip_line:
+                # Tail of an oversized line already reported
+                self._skip_line = False
+                continue
+            self._line += 1
+            if not line.strip():
+                continue
+            if len(line) > PROCESS_MAX_ITEM_BYTES:
+                items.append(self._item(error=f"Line {self._line} exceeds {PROCESS_MAX_ITEM_BYTES} bytes"))
+                continue
+            try:
+                items.append(self._item(orjson.loads(line)))
+            except orjson.JSONDecodeError as e:
+                items.append(self._item(error=f"Invalid JSON on line {self._line}: {e}"))
+
+        if len(self._raw) > PROCESS_MAX_ITEM_BYTES:
+            # Report an oversized line once and drop it up to its newline
+            if not self._skip_line:
+                self._line += 1
+                items.append(self._item(error=f"Line {self._line} exceeds {PROCESS_MAX_ITEM_BYTES} bytes"))
+            self._raw = b""
+            self._skip_line = True
+        return items
+
+    def _feed_array(self, final: bool) -> List[BulkItem]:
+        items = []
+        position = 0
+        buffer = self._buffer
+        while not self._array_done:
+            # Skip whitespace and the separator before the next element
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                self._array_done = True
+                position += 1
+                break
+            try:
+                payload, end = self._json.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if not final and len(buffer) - position <= PROCESS_MAX_ITEM_BYTES:
+                    # Most likely an element split across chunks; wait for more
+                    break
+                items.append(self._item(error=f"Invalid JSON array: {e.msg}"))
+                self._array_done = True
+                break
+            # A character takes at most 4 bytes, so only long elements need encoding to be measured
+            if end - position > PROCESS_MAX_ITEM_BYTES // 4 and len(buffer[position:end].encode("utf-8")) > PROCESS_MAX_ITEM_BYTES:
+                items.append(self._item(error=f"Item {self._index} exceeds {PROCESS_MAX_ITEM_BYTES} bytes"))
+            else:
+                items.append(self._item(payload))
+            position = end
+        self._buffer = buffer[position:]
+        if final and not self._array_done:
+            items.append(self._item(error="Invalid JSON array: missing closing ']'"))
+            self._array_done = True
+        return items
+
+async def read_batches(body: AsyncIterator[bytes], queue: asyncio.Queue, body_read: Optional[asyncio.Event] = None):
+    """
+    Parses the streamed body into batches of PROCESS_BATCH_SIZE items.
+    The bounded queue stalls reading while the encoder is behind.
+    `body_read` is set once the body has been consumed (or failed).
+    """
+    parser = BodyParser()
+    batch: List[BulkItem] = []
+    try:
+        try:
+            async for chunk in body:
+                for item in parser.feed(chunk):
+                    batch.append(item)
+                    if len(batch) >= PROCESS_BATCH_SIZE:
+                        await queue.put(batch)
+                        batch = []
+        finally:
+            if body_read is not None:
+                body_read.set()
+        batch.extend(parser.feed(b"", final=True))
+        if batch:
+            await queue.put(batch)
+    finally:
+        await queue.put(None)
+
+async def process_batch(items: List[BulkItem], fmt: str, include_vectors: bool) -> List[Dict[str, Any]]:
+    """
+    normalize -> one batched encode -> concurrent saves (group-committed by
+    the write buffer). Returns one result line per item, in input order.
+    """
+    results: Dict[int, Dict[str, Any]] = {}
+    valid = []
+    for index, payload, error in items:
+        if error is not None:
+            results[index] = {"index": index, "status": "invalid", "error": error}
+        else:
+            valid.append((index, payload))
+
+    job_ids = [payload.get("job_id") or payload.get("id") or str(uuid.uuid4()) for _, payload in valid]
+    normalized = []
+    for (index, _), canonical_job in zip(valid, normalize_jobs([payload for _, payload in valid], job_ids)):
+        if isinstance(canonical_job, Exception):
+            results[index] = {"index": index, "status": "invalid", "error": str(canonical_job)}
+        else:
+            normalized.append((index, canonical_job))
+
+    if normalized:
+        try:
+            batch_embeddings = await embed_deduplicated([canonical_job for _, canonical_job in normalized], batcher.embed_jobs)
+        except Exception as e:
+            batch_embeddings = None
+            for index, canonical_job in normalized:
+                results[index] = {"index": index, "job_id": canonical_job.job_id, "status": "failed", "error": f"Embedding failed: {e}"}
+
+        if batch_embeddings is not None:
+            jobs = [
+                EmbeddedJob(
+                    job_id=canonical_job.job_id,
+                    cleaned_job=canonical_job.job_data,
+                    embeddings=embeddings,
+                    metadata=get_metadata(embeddings, duplicate_of)
+                )
+                for (_, canonical_job), (embeddings, duplicate_of) in zip(normalized, batch_embeddings)
+            ]
+            saved = await asyncio.gather(*[save_job(job) for job in jobs], return_exceptions=True)
+            for (index, _), job, outcome in zip(normalized, jobs, saved):
+                if isinstance(outcome, Exception):
+                    results[index] = {"index": index, "job_id": job.job_id, "status": "failed", "error": f"Save failed: {outcome}"}
+                elif include_vectors:
+                    results[index] = {"index": index, "status": "ok", **job_output_content(job, fmt)}
+                else:
+                    results[index] = {"index": index, "job_id": job.job_id, "status": "ok", "metadata": job.metadata.model_dump()}
+
+    return [results[index] for index, _, _ in items]
+
+async def stream_results(body: AsyncIterator[bytes], fmt: str, include_vectors: bool, body_read: Optional[asyncio.Event] = None) -> AsyncIterator[bytes]:
+    """
+    NDJSON result stream for /process/batch. Parsing runs one step ahead
+    of encoding and saving, with at most PROCESS_BATCH_PREFETCH parsed
+    batches waiting.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=PROCESS_BATCH_PREFETCH)
+    reader = asyncio.create_task(read_batches(body, queue, body_read))
+    try:
+        while True:
+            items = await queue.get()
+            if items is None:
+                break
+            lines = await process_batch(items, fmt, include_vectors)
+            yield b"".join(
+                orjson.dumps(line, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+                for line in lines
+            )
+        # Surface a body read error (e.g. client disconnect)
+        await reader
+    finally:
+        reader.cancel()
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for a handler that reads the request body while it
+    streams results back. The stock one listens for http.disconnect by
+    consuming receive() from the start (on ASGI servers below spec 2.4),
+    which would swallow that body; this one starts listening once
+    `body_read` is set. A client that goes away cancels the stream, and
+    `background` runs however the response ends.
+    """
+
+    def __init__(self, content, body_read: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive) -> None:
+        await self.body_read.wait()
+        await super().listen_for_disconnect(receive)
+
+    async def __call__(self, scope, receive, send) -> None:
+        streaming = asyncio.create_task(self.stream_response(send))
+        disconnected = asyncio.create_task(self.listen_for_disconnect(receive))
+        try:
+            await asyncio.wait({streaming, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (streaming, disconnected):
+                task.cancel()
+            await asyncio.gather(streaming, disconnected, return_exceptions=True)
+            if self.background is not None:
+                await self.background()
+        if not streaming.cancelled() and streaming.exception() is not None:
+            raise streaming.exception()
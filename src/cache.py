@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Entries kept in the in-memory LRU tier (0 disables the cache)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+# Optional SQLite file used as a persistent tier shared across restarts
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+def cache_key(model_name: str, section: str, text: str) -> str:
+    # Whitespace differences tokenize identically, so they share an entry
+    normalized = re.sub(r'\s+', ' ', text).strip()
+    return hashlib.sha1(f"{model_name}\x00{section}\x00{normalized}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of section vectors keyed on
+    (model name, section kind, normalized text hash).
+
+    Lookups go to a bounded in-memory LRU first, then to the optional
+    on-disk tier. Only texts missing from both are sent to the encoder.
+    """
+
+    def __init__(self, model_name: str, capacity: int = EMBEDDING_CACHE_SIZE, path: Optional[str] = EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.capacity = capacity
+        self.path = path
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # Inference threads share the cache
+        self._lock = threading.Lock()
+        self._disk = None
+
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._disk.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _load_from_disk(self, keys: List[str]) -> dict:
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._disk.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def encode(self, items: List[Tuple[str, str]], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Returns one vector per (section, text) item, encoding only cache misses.
+        """
+        keys = [cache_key(self.model_name, section, text) for section, text in items]
+        vectors: List[Optional[np.ndarray]] = [None] * len(items)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[i] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing and self._disk is not None:
+                for key, vector in self._load_from_disk(list(missing)).items():
+                    for i in missing.pop(key):
+                        vectors[i] = vector
+                        self.disk_hits += 1
+                    self._remember(key, vector)
+
+        if missing:
+            # Repeated texts within the batch are encoded once
+            miss_keys = list(missing)
+            encoded = np.asarray(encode_fn([items[missing[key][0]][1] for key in miss_keys]), dtype=np.float32)
+
+            with self._lock:
+                for key, vector in zip(miss_keys, encoded):
+                    for i in missing[key]:
+                        vectors[i] = vector
+                    self.misses += 1
+                    self.hits += len(missing[key]) - 1
+                    self._remember(key, vector)
+
+                if self._disk is not None:
+                    self._disk.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        [(key, vector.tobytes()) for key, vector in zip(miss_keys, encoded)]
+                    )
+                    self._disk.commit()
+
+        return np.stack(vectors)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "capacity": self.capacity,
+            "size": len(self._memory),
+            "persistent": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
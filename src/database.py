@@ -1,7 +1,13 @@
 import os
+from datetime import datetime, timezone
 import certifi
 from motor.motor_asyncio import AsyncIOMotorClient
-from src.schemas import JobOutput
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+from src.job_vectors import EmbeddedJob
+from src.write_buffer import write_buffer, WRITE_BUFFER_MAX_SIZE
+from src.vector_codec import encode_job_embeddings
+from src.vector_index import add_to_snapshot, record_from_output
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,14 +15,58 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "conductor_db")
 COLLECTION_NAME = os.getenv("DB_COLLECTION", "jobs")
+# Connection pool size per client (driver default is 100)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+# Write concern "w" value, e.g. "majority" or "1" (unset uses the server default)
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN")
 
 client = None
 db = None
 
+# Embedding lifecycle of a job document. Jobs waiting for (or being given)
+# embeddings also carry `embedding_enqueued_at`, which is removed once they
+# are done or failed, so the partial queue index only holds the backlog.
+EMBEDDING_PENDING = "pending"
+EMBEDDING_PROCESSING = "processing"
+EMBEDDING_DONE = "done"
+EMBEDDING_FAILED = "failed"
+
+async def ensure_indexes():
+    collection = db[COLLECTION_NAME]
+    
+    # Backs save_job's upserts; documents inserted by other apps may have no job_id
+    try:
+        await collection.create_index(
+            [("job_id", ASCENDING)],
+            name="job_id_unique",
+            unique=True,
+            partialFilterExpression={"job_id": {"$exists": True}}
+        )
+    except OperationFailure as e:
+        # Usually duplicate job_ids already stored; upserts still work, just unindexed
+        print(f"⚠️ Could not create unique index on job_id: {e}")
+    
+    # FIFO work queue for the watcher, covering only jobs that are not done
+    await collection.create_index(
+        [("embedding_enqueued_at", ASCENDING)],
+        name="embedding_queue",
+        partialFilterExpression={"embedding_enqueued_at": {"$exists": True}}
+    )
+    
+    # Lets search snapshots pull only vectors written since their last sync
+    await collection.create_index(
+        [("embedded_at", ASCENDING)],
+        name="embedded_at",
+        partialFilterExpression={"embedded_at": {"$exists": True}}
+    )
+
 async def connect_to_mongo():
     global client, db
     print(f"Connecting to MongoDB at {MONGO_URI}...")
-    client = AsyncIOMotorClient(MONGO_URI, tlsCAFile=certifi.where())
+    client_options = {"tlsCAFile": certifi.where(), "maxPoolSize": MONGO_MAX_POOL_SIZE}
+    if MONGO_WRITE_CONCERN:
+        client_options["w"] = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    client = AsyncIOMotorClient(MONGO_URI, **client_options)
     db = client[DB_NAME]
     # Verify connection
     try:
@@ -25,31 +75,55 @@ async def connect_to_mongo():
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
         raise e
+    
+    await ensure_indexes()
+    
+    # Coalesce save_job upserts from concurrent callers into bulk writes
+    if WRITE_BUFFER_MAX_SIZE > 1:
+        write_buffer.start(db[COLLECTION_NAME])
 
 async def close_mongo_connection():
     global client
+    await write_buffer.stop()
     if client:
         client.close()
         print("MongoDB connection closed.")
 
-async def save_job(job_output: JobOutput):
+async def save_job(job: EmbeddedJob):
     """
     Saves the processed job to MongoDB.
     Uses 'job_id' as the unique identifier for upsert operations.
+    Upserts go through the write-behind buffer, which commits concurrent
+    saves together; returns the upserted _id, or None if the job existed.
     """
     if db is None:
         raise RuntimeError("Database not initialized. Call connect_to_mongo() first.")
     
     collection = db[COLLECTION_NAME]
     
-    # Convert Pydantic model to dict
-    document = job_output.model_dump()
+    # Same layout as JobOutput, with vectors written straight from the batch
+    # matrix in the configured storage format
+    document = {
+        "job_id": job.job_id,
+        "cleaned_job": job.cleaned_job.model_dump(),
+        "embeddings": encode_job_embeddings(job.embeddings),
+        "metadata": job.metadata.model_dump()
+    }
+    # Embedded here, so the watcher never needs to queue it
+    document["embedding_state"] = EMBEDDING_DONE
+    document["embedded_at"] = datetime.now(timezone.utc)
     
     # Use job_id as the filter for upsert
-    result = await collection.update_one(
-        {"job_id": job_output.job_id},
-        {"$set": document},
-        upsert=True
-    )
+    job_filter = {"job_id": job.job_id}
+    update = {"$set": document, "$unset": {"embedding_enqueued_at": "", "embedding_claim": ""}}
+    
+    if WRITE_BUFFER_MAX_SIZE > 1:
+        upserted_id = await write_buffer.submit(job.job_id, UpdateOne(job_filter, update, upsert=True))
+    else:
+        result = await collection.update_one(job_filter, update, upsert=True)
+        upserted_id = result.upserted_id
+    
+    # Make the job searchable in this process without waiting for the next sync
+    add_to_snapshot([record_from_output(job.job_id, job.embeddings, job.cleaned_job)])
     
-    return result
+    return upserted_id
@@ -0,0 +1,247 @@
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from src.embedder import generate_text_representation, get_section_values
+from src.job_vectors import JobEmbeddings, SECTIONS
+from src.schemas import CanonicalJob, JobData
+
+load_dotenv()
+
+# Reuse the embeddings of an earlier near-identical posting instead of encoding again
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "0") == "1"
+# Estimated Jaccard similarity of title + description shingles that counts as a duplicate
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+# MinHash signature length (hash functions per signature)
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+# LSH bands the signature is split into; must divide DEDUP_NUM_PERM
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+# Words per shingle
+DEDUP_SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", "3"))
+# Canonical jobs kept in the LSH index, ~8 KB each (least recently matched are evicted)
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "20000"))
+
+# Sections compared by signature; the others must match exactly
+SIGNATURE_SECTIONS = ("title", "description")
+
+# Universal hashing (a * x + b) mod p over 31-bit shingle hashes
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(1, int(_PRIME), DEDUP_NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), DEDUP_NUM_PERM, dtype=np.uint64)
+
+def minhash_signature(text: str, shingle_words: int = DEDUP_SHINGLE_WORDS) -> Optional[np.ndarray]:
+    """
+    MinHash signature (DEDUP_NUM_PERM uint32 values) of the word shingles
+    of `text`, ignoring case, punctuation and whitespace. None if the text
+    has no words.
+    """
+    words = re.findall(r"\w+", text.casefold())
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + shingle_words]) for i in range(max(1, len(words) - shingle_words + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    hashes %= _PRIME
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+class JobFingerprint:
+    """
+    What a job is compared on: the MinHash signature of its title and
+    description, and the exact (whitespace-collapsed) text of its other
+    sections. `texts` are the section texts the job would be embedded with.
+    """
+    __slots__ = ("signature", "exact", "texts")
+
+    def __init__(self, signature: Optional[np.ndarray], exact: Tuple, texts: Tuple[Optional[str], ...]):
+        self.signature = signature
+        self.exact = exact
+        self.texts = texts
+
+def fingerprint(job_data: JobData) -> JobFingerprint:
+    texts = {
+        section: generate_text_representation(section, value)
+        for section, value in get_section_values(job_data).items()
+    }
+    signature = minhash_signature(" ".join(texts[section] or "" for section in SIGNATURE_SECTIONS))
+    exact = tuple(
+        re.sub(r"\s+", " ", texts[section]).strip() if texts[section] else None
+        for section in SECTIONS if section not in SIGNATURE_SECTIONS
+    )
+    # Sections present must line up with the canonical job's vectors
+    exact += tuple(bool(texts[section]) for section in SIGNATURE_SECTIONS)
+    return JobFingerprint(signature, exact, tuple(texts[section] for section in SECTIONS))
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    # Fraction of equal MinHash values estimates the Jaccard similarity
+    return float(np.count_nonzero(a == b)) / len(a)
+
+class DuplicateIndex:
+    """
+    LSH index over the fingerprints of recently embedded canonical jobs.
+
+    Signatures are split into DEDUP_BANDS bands; jobs sharing any band are
+    candidates, and a candidate is a duplicate if its estimated similarity
+    reaches the threshold and its other sections match exactly. A
+    duplicate gets the canonical job's vectors (with its own section
+    texts) and is not sent to the encoder.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, bands: int = DEDUP_BANDS, capacity: int = DEDUP_MAX_ENTRIES):
+        if DEDUP_NUM_PERM % bands:
+            raise ValueError(f"DEDUP_BANDS ({bands}) must divide DEDUP_NUM_PERM ({DEDUP_NUM_PERM})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows_per_band = DEDUP_NUM_PERM // bands
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Tuple[JobFingerprint, JobEmbeddings]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+
+        self.lookups = 0
+        self.duplicates = 0
+        self.evictions = 0
+        self.texts_encoded = 0
+        self.texts_skipped = 0
+        self.encode_s = 0.0
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        rows = self.rows_per_band
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def find(self, job_fingerprint: JobFingerprint) -> Optional[Tuple[str, JobEmbeddings]]:
+        if job_fingerprint.signature is None:
+            return None
+        candidates = set()
+        for key in self._band_keys(job_fingerprint.signature):
+            candidates |= self._buckets.get(key, set())
+
+        best = None
+        best_score = self.threshold
+        for job_id in candidates:
+            canonical, embeddings = self._entries[job_id]
+            if canonical.exact != job_fingerprint.exact:
+                continue
+            score = similarity(canonical.signature, job_fingerprint.signature)
+            if score >= best_score:
+                best, best_score = job_id, score
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        return best, self._entries[best][1]
+
+    def add(self, job_id: str, job_fingerprint: JobFingerprint, embeddings: JobEmbeddings):
+        if job_fingerprint.signature is None:
+            return
+        self._remove(job_id)
+        # Copied so the entry does not keep its whole batch matrix alive
+        self._entries[job_id] = (job_fingerprint, JobEmbeddings(embeddings.texts, embeddings.matrix.copy(), embeddings.present.copy()))
+        for key in self._band_keys(job_fingerprint.signature):
+            self._buckets.setdefault(key, set()).add(job_id)
+        while len(self._entries) > self.capacity:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, job_id: str):
+        entry = self._entries.pop(job_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry[0].signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(job_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    async def embed(
+        self,
+        jobs: List[CanonicalJob],
+        embed_fn: Callable[[List[JobData]], Awaitable[List[JobEmbeddings]]],
+        fingerprints: Optional[List[JobFingerprint]] = None
+    ) -> List[Tuple[JobEmbeddings, Optional[str]]]:
+        """
+        Embeds a batch, encoding only jobs that are not near-duplicates of
+        an indexed job or of an earlier job in the same batch. Returns
+        (embeddings, canonical job_id or None) per job.
+        """
+        if fingerprints is None:
+            fingerprints = [fingerprint(job.job_data) for job in jobs]
+
+        # job index -> (canonical job_id, embeddings) or canonical index in this batch
+        links: Dict[int, object] = {}
+        unique: List[int] = []
+        for i, job_fingerprint in enumerate(fingerprints):
+            self.lookups += 1
+            found = self.find(job_fingerprint)
+            if found is None and job_fingerprint.signature is not None:
+                found = next((
+                    j for j in unique
+                    if fingerprints[j].signature is not None
+                    and fingerprints[j].exact == job_fingerprint.exact
+                    and similarity(fingerprints[j].signature, job_fingerprint.signature) >= self.threshold
+                ), None)
+            if found is None:
+                unique.append(i)
+            else:
+                links[i] = found
+
+        encoded: Dict[int, JobEmbeddings] = {}
+        if unique:
+            started = time.perf_counter()
+            batch_embeddings = await embed_fn([jobs[i].job_data for i in unique])
+            self.encode_s += time.perf_counter() - started
+            for i, embeddings in zip(unique, batch_embeddings):
+                encoded[i] = embeddings
+                self.texts_encoded += int(embeddings.present.sum())
+                self.add(jobs[i].job_id, fingerprints[i], embeddings)
+
+        results = []
+        for i, job in enumerate(jobs):
+            if i in encoded:
+                results.append((encoded[i], None))
+                continue
+            link = links[i]
+            canonical_id, canonical = (jobs[link].job_id, encoded[link]) if isinstance(link, int) else link
+            self.duplicates += 1
+            self.texts_skipped += int(canonical.present.sum())
+            # Same vectors, but stored next to this job's own section texts
+            embeddings = JobEmbeddings(fingerprints[i].texts, canonical.matrix, canonical.present)
+            results.append((embeddings, canonical_id if canonical_id != job.job_id else None))
+        return results
+
+    def stats(self) -> dict:
+        per_text_s = self.encode_s / self.texts_encoded if self.texts_encoded else 0.0
+        return {
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "lookups": self.lookups,
+            "duplicates": self.duplicates,
+            "duplicate_rate": self.duplicates / self.lookups if self.lookups else 0.0,
+            "texts_encoded": self.texts_encoded,
+            "texts_skipped": self.texts_skipped,
+            # Estimated from the average encode time per section text
+            "encode_s": round(self.encode_s, 3),
+            "encode_s_saved": round(self.texts_skipped * per_text_s, 3)
+        }
+
+_INDEX = DuplicateIndex() if DEDUP_ENABLED else None
+
+def get_duplicate_index() -> Optional[DuplicateIndex]:
+    return _INDEX
+
+async def embed_deduplicated(
+    jobs: List[CanonicalJob],
+    embed_fn: Callable[[List[JobData]], Awaitable[List[JobEmbeddings]]],
+    fingerprints: Optional[List[JobFingerprint]] = None
+) -> List[Tuple[JobEmbeddings, Optional[str]]]:
+    """
+    Embeds canonical jobs with `embed_fn`, skipping near-duplicates when
+    DEDUP_ENABLED. Returns (embeddings, duplicate_of) per job.
+    """
+    if _INDEX is None:
+        return [(embeddings, None) for embeddings in await embed_fn([job.job_data for job in jobs])]
+    return await _INDEX.embed(jobs, embed_fn, fingerprints)
@@ -1,25 +1,86 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import os
+import threading
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from src.schemas import JobData, Embeddings, EmbeddingData, Metadata
+from src.schemas import JobData, Metadata
+from src.job_vectors import JobEmbeddings, batch_embeddings
+from src.cache import EmbeddingCache, EMBEDDING_CACHE_SIZE
+from src.skill_vocab import SkillVocabulary, SKILL_VECTOR_MODE
 
 # Load environment variables
 load_dotenv()
 
+MODEL_NAME = "BAAI/bge-small-en-v1.5"
+VECTOR_DIMENSION = 384
+
+# "torch" runs the model through PyTorch, "onnx" through ONNX Runtime
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Optional int8 dynamic quantization for the ONNX backend: avx2, avx512, avx512_vnni or arm64
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION")
+# Where the quantized ONNX export is written and reloaded from
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/bge-small-en-v1.5-onnx")
+
+def get_model_id(backend: str = EMBEDDING_BACKEND, quantization: Optional[str] = ONNX_QUANTIZATION) -> str:
+    """
+    Identifies the exact weights producing vectors, so cached vectors from
+    one backend are never served for another.
+    """
+    if backend == "onnx":
+        return f"{MODEL_NAME}@onnx-qint8-{quantization}" if quantization else f"{MODEL_NAME}@onnx"
+    return MODEL_NAME
+
+def load_model(backend: str = EMBEDDING_BACKEND, quantization: Optional[str] = ONNX_QUANTIZATION):
+    # Imported here so importing this module (and the API) does not pull in torch
+    from sentence_transformers import SentenceTransformer
+    
+    token = os.getenv("HF_TOKEN")
+    print(f"Loading embedding model {get_model_id(backend, quantization)}... (Token present: {bool(token)})")
+    
+    if backend == "torch":
+        return SentenceTransformer(MODEL_NAME, token=token)
+    
+    if backend != "onnx":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Expected 'torch' or 'onnx'.")
+    
+    # Requires: pip install "sentence-transformers[onnx]"
+    if not quantization:
+        return SentenceTransformer(MODEL_NAME, backend="onnx", token=token)
+    
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(ONNX_MODEL_DIR, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        print(f"Exporting int8 ({quantization}) ONNX model to {ONNX_MODEL_DIR}...")
+        exported = SentenceTransformer(MODEL_NAME, backend="onnx", token=token)
+        exported.save_pretrained(ONNX_MODEL_DIR)
+        export_dynamic_quantized_onnx_model(exported, quantization, ONNX_MODEL_DIR)
+    
+    return SentenceTransformer(ONNX_MODEL_DIR, backend="onnx", model_kwargs={"file_name": file_name})
+
 # Global model instance
 _MODEL = None
+# Inference runs on several executor threads; only one of them may load the model
+_MODEL_LOCK = threading.Lock()
 
 def get_model():
     global _MODEL
     if _MODEL is None:
-        # Load the model with optional token
-        token = os.getenv("HF_TOKEN")
-        print(f"Loading embedding model BAAI/bge-small-en-v1.5... (Token present: {bool(token)})")
-        _MODEL = SentenceTransformer('BAAI/bge-small-en-v1.5', token=token)
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                _MODEL = load_model()
     return _MODEL
 
+def warm_up_model():
+    """
+    Loads the model and runs a dummy batch through it so the first real
+    request does not pay for lazy initialisation.
+    """
+    encode_texts([
+        "Senior Backend Engineer",
+        "Python, MongoDB, Docker, Kubernetes",
+        "We need an expert in Python, FastAPI, and Vector Databases to build scalable microservices."
+    ])
+
 def generate_text_representation(field_name: str, value: Any) -> Optional[str]:
     if not value:
         return None
@@ -39,46 +100,220 @@ def generate_text_representation(field_name: str, value: Any) -> Optional[str]:
         
     return str(value)
 
-def generate_embeddings(job_data: JobData) -> Embeddings:
-    model = get_model()
-    
-    sections_to_embed = {
+SECTION_NAMES = ["title", "required_skills", "responsibilities", "qualifications", "description"]
+
+def get_section_values(job_data: JobData) -> Dict[str, Any]:
+    return {
         "title": job_data.title,
         "required_skills": job_data.sections.required_skills,
         "responsibilities": job_data.sections.responsibilities,
         "qualifications": job_data.sections.qualifications,
         "description": job_data.sections.description
     }
+
+# Optional multi-process encoder pool (see src/encoder_pool.py)
+_ENCODER_POOL = None
+
+def set_encoder_pool(pool):
+    global _ENCODER_POOL
+    _ENCODER_POOL = pool
+
+# Group texts of similar token length so short titles are not padded to paragraph length
+LENGTH_BUCKETING = os.getenv("LENGTH_BUCKETING", "1") == "1"
+# Maximum padded tokens (batch size x longest sequence) per forward pass
+ENCODE_TOKEN_BUDGET = int(os.getenv("ENCODE_TOKEN_BUDGET", "8192"))
+
+_PADDING_STATS = {"batches": 0, "texts": 0, "real_tokens": 0, "padded_tokens": 0, "unbucketed_padded_tokens": 0}
+_PADDING_LOCK = threading.Lock()
+
+def plan_length_buckets(lengths: List[int], token_budget: int = ENCODE_TOKEN_BUDGET) -> List[List[int]]:
+    """
+    Splits text indices into batches of similar length.
+    Indices are sorted by token length and a batch is closed as soon as
+    adding the next text would push batch_size * longest_length over the budget.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets = []
+    current = []
+    for i in order:
+        # Sorted ascending, so the newest text is always the longest in the batch
+        if current and (len(current) + 1) * lengths[i] > token_budget:
+            buckets.append(current)
+            current = []
+        current.append(i)
+    if current:
+        buckets.append(current)
+    return buckets
+
+def default_padded_tokens(lengths: List[int], batch_size: int = 32) -> int:
+    # Padding model.encode would add on its own: it already sorts texts by
+    # length and pads each batch of batch_size (default 32) to its longest
+    ordered = sorted(lengths)
+    batches = [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
+    return sum(len(batch) * batch[-1] for batch in batches)
+
+def encode_texts_measured(texts: List[str]) -> Tuple[np.ndarray, Optional[Dict[str, int]]]:
+    """
+    Encodes a flat list of texts with this process's model.
+    Texts are tokenized first and encoded in length buckets under a token
+    budget; vectors come back in the original order.
+    Returns a (len(texts), dim) array of L2-normalized vectors and the
+    padding counters of the call (None without LENGTH_BUCKETING), which
+    the caller adds to the stats of its own process.
+    """
+    model = get_model()
+    if not LENGTH_BUCKETING:
+        # normalize_embeddings=True ensures L2 normalization
+        return model.encode(texts, normalize_embeddings=True, convert_to_numpy=True), None
     
-    embedding_results = {}
+    lengths = [
+        len(ids) for ids in model.tokenizer(
+            texts, add_special_tokens=True, truncation=True, max_length=model.max_seq_length
+        )["input_ids"]
+    ]
+    buckets = plan_length_buckets(lengths)
     
-    for key, value in sections_to_embed.items():
-        text = generate_text_representation(key, value)
-        vector = None
-        
-        if text:
-            # Generate embedding
-            # normalize_embeddings=True ensures L2 normalization
-            emb = model.encode(text, normalize_embeddings=True)
-            vector = emb.tolist()
-            
-        embedding_results[key] = EmbeddingData(text=text, vector=vector)
-        
-    return Embeddings(
-        title=embedding_results["title"],
-        required_skills=embedding_results["required_skills"],
-        responsibilities=embedding_results["responsibilities"],
-        qualifications=embedding_results["qualifications"],
-        description=embedding_results["description"]
-    )
+    vectors = np.zeros((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    padded_tokens = 0
+    for bucket in buckets:
+        # One forward pass per bucket
+        vectors[bucket] = model.encode(
+            [texts[i] for i in bucket],
+            batch_size=len(bucket),
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        padded_tokens += len(bucket) * max(lengths[i] for i in bucket)
+    
+    return vectors, {
+        "batches": len(buckets),
+        "texts": len(texts),
+        "real_tokens": sum(lengths),
+        "padded_tokens": padded_tokens,
+        "unbucketed_padded_tokens": default_padded_tokens(lengths)
+    }
+
+def add_padding_stats(padding: Optional[Dict[str, int]]):
+    if not padding:
+        return
+    with _PADDING_LOCK:
+        for key, value in padding.items():
+            _PADDING_STATS[key] += value
+
+def encode_texts_local(texts: List[str]) -> np.ndarray:
+    vectors, padding = encode_texts_measured(texts)
+    add_padding_stats(padding)
+    return vectors
+
+def get_padding_stats() -> dict:
+    with _PADDING_LOCK:
+        stats = dict(_PADDING_STATS)
+    stats["enabled"] = LENGTH_BUCKETING
+    stats["token_budget"] = ENCODE_TOKEN_BUDGET
+    stats["padding_efficiency"] = stats["real_tokens"] / stats["padded_tokens"] if stats["padded_tokens"] else 1.0
+    return stats
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """
+    Encodes a flat list of texts, sharded across the encoder pool when one
+    is running and on the local model otherwise.
+    """
+    if _ENCODER_POOL is not None:
+        return _ENCODER_POOL.encode(texts)
+    return encode_texts_local(texts)
+
+# Content-addressed cache in front of the encoder (disabled when EMBEDDING_CACHE_SIZE=0)
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def get_cache() -> Optional[EmbeddingCache]:
+    # Created on first use rather than at import: encoder pool workers import
+    # this module but only run encode_texts_measured, so they never open a
+    # SQLite connection and LRU of their own
+    global _CACHE
+    if _CACHE is None and EMBEDDING_CACHE_SIZE > 0:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EmbeddingCache(get_model_id())
+    return _CACHE
+
+# Per-skill vector table used when SKILL_VECTOR_MODE=composed
+_SKILL_VOCAB = SkillVocabulary(VECTOR_DIMENSION, get_model_id()) if SKILL_VECTOR_MODE == "composed" else None
+
+def get_skill_vocabulary() -> Optional[SkillVocabulary]:
+    return _SKILL_VOCAB
+
+def _encode_cached(items: List[Tuple[str, str]]) -> np.ndarray:
+    cache = get_cache()
+    if cache is None:
+        return encode_texts([text for _, text in items])
+    return cache.encode(items, encode_texts)
+
+def encode_sections(items: List[Tuple[str, str]]) -> np.ndarray:
+    """
+    Encodes (section, text) pairs, serving repeated section texts from the
+    embedding cache and sending only unseen ones to the encoder.
+    In composed skill mode, required_skills vectors are built from the
+    per-skill table instead of a model pass over the joined string.
+    """
+    if _SKILL_VOCAB is None:
+        return _encode_cached(items)
+    
+    skill_rows = [i for i, (section, _) in enumerate(items) if section == "required_skills"]
+    if not skill_rows:
+        return _encode_cached(items)
+    
+    vectors = np.zeros((len(items), VECTOR_DIMENSION), dtype=np.float32)
+    vectors[skill_rows] = _SKILL_VOCAB.compose([items[i][1] for i in skill_rows], encode_texts)
+    
+    other_rows = [i for i, (section, _) in enumerate(items) if section != "required_skills"]
+    if other_rows:
+        vectors[other_rows] = _encode_cached([items[i] for i in other_rows])
+    return vectors
+
+def gather_section_texts(jobs: List[JobData]):
+    """
+    Builds the text representation of every section of every job.
+    Returns the per-job section texts and the flat list of non-empty
+    (section, text) pairs in the order their vectors are expected by
+    assemble_embeddings.
+    """
+    section_texts = []
+    pending_items = []
+    
+    for job_data in jobs:
+        texts = {}
+        for key, value in get_section_values(job_data).items():
+            text = generate_text_representation(key, value)
+            texts[key] = text
+            if text:
+                pending_items.append((key, text))
+        section_texts.append(texts)
+    
+    return section_texts, pending_items
+
+def assemble_embeddings(section_texts: List[Dict[str, Optional[str]]], vectors) -> List[JobEmbeddings]:
+    """
+    Scatters a flat array of vectors back into one JobEmbeddings per job,
+    all views into a single float32 matrix for the batch.
+    """
+    return batch_embeddings(section_texts, vectors, VECTOR_DIMENSION)
+
+def generate_embeddings_batch(jobs: List[JobData]) -> List[JobEmbeddings]:
+    """
+    Embeds every non-empty section of every job with one encode call.
+    Section texts are gathered into a flat list, encoded together and the
+    vectors are scattered back into one JobEmbeddings per job.
+    """
+    section_texts, pending_items = gather_section_texts(jobs)
+    vectors = encode_sections(pending_items) if pending_items else []
+    return assemble_embeddings(section_texts, vectors)
+
+def generate_embeddings(job_data: JobData) -> JobEmbeddings:
+    return generate_embeddings_batch([job_data])[0]
 
-def get_metadata(embeddings: Embeddings) -> Metadata:
-    sections_embedded = []
-    if embeddings.title.vector: sections_embedded.append("title")
-    if embeddings.required_skills.vector: sections_embedded.append("required_skills")
-    if embeddings.responsibilities.vector: sections_embedded.append("responsibilities")
-    if embeddings.qualifications.vector: sections_embedded.append("qualifications")
-    if embeddings.description.vector: sections_embedded.append("description")
+def get_metadata(embeddings: JobEmbeddings, duplicate_of: Optional[str] = None) -> Metadata:
+    sections_embedded = embeddings.sections_embedded
     
     # "embedding_ready=false if critical sections cannot be embedded"
     # Let's assume title and at least one other section is critical, or just if anything was embedded.
@@ -87,8 +322,9 @@ def get_metadata(embeddings: Embeddings) -> Metadata:
     is_ready = bool(sections_embedded) 
     
     return Metadata(
-        embedding_model="BAAI/bge-small-en-v1.5",
-        vector_dimension=384,
+        embedding_model=get_model_id(),
+        vector_dimension=VECTOR_DIMENSION,
         sections_embedded=sections_embedded,
-        embedding_ready=is_ready
+        embedding_ready=is_ready,
+        duplicate_of=duplicate_of
     )
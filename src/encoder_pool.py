@@ -0,0 +1,93 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src import embedder
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Number of encoder worker processes (0 disables the pool)
+ENCODER_PROCESSES = int(os.getenv("ENCODER_PROCESSES", "0"))
+# Smallest shard worth sending to a worker; tiny batches stay on one process
+ENCODER_MIN_SHARD = int(os.getenv("ENCODER_MIN_SHARD", "8"))
+
+def _init_worker(threads: int):
+    # Split the cores between workers instead of letting every process
+    # spin up one intra-op thread per core and oversubscribe the CPU.
+    import torch
+    torch.set_num_threads(threads)
+    embedder.get_model()
+
+def _encode_shard(texts: List[str]) -> Tuple[np.ndarray, Optional[Dict[str, int]]]:
+    # Padding counters go back to the parent, whose /stats reports them
+    return embedder.encode_texts_measured(texts)
+
+class EncoderPool:
+    """
+    Pool of worker processes, each holding its own copy of the model.
+    Batches are split into contiguous shards, encoded in parallel and
+    concatenated back in order.
+    """
+
+    def __init__(self, processes: int = ENCODER_PROCESSES, min_shard: int = ENCODER_MIN_SHARD):
+        self.processes = processes
+        self.min_shard = min_shard
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        if self._executor is not None:
+            return
+        threads = max(1, (os.cpu_count() or 1) // self.processes)
+        print(f"Starting encoder pool with {self.processes} processes ({threads} threads each)...")
+        # spawn keeps workers independent of the parent's torch/event loop state
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,)
+        )
+        # Load the model in every worker up front instead of on the first batch
+        list(self._executor.map(_encode_shard, [["warm up"]] * self.processes))
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            print("Encoder pool stopped.")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self._executor is None:
+            raise RuntimeError("Encoder pool not started. Call start() first.")
+
+        shards = max(1, min(self.processes, len(texts) // self.min_shard))
+        shard_size = math.ceil(len(texts) / shards)
+        chunks = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        results = list(self._executor.map(_encode_shard, chunks))
+        for _, padding in results:
+            embedder.add_padding_stats(padding)
+        return np.concatenate([vectors for vectors, _ in results])
+
+_POOL: Optional[EncoderPool] = None
+
+def start_encoder_pool(processes: int = ENCODER_PROCESSES) -> Optional[EncoderPool]:
+    """
+    Starts the shared pool and routes embedder.encode_texts through it.
+    Does nothing when processes < 1.
+    """
+    global _POOL
+    if processes < 1 or _POOL is not None:
+        return _POOL
+    _POOL = EncoderPool(processes)
+    _POOL.start()
+    embedder.set_encoder_pool(_POOL)
+    return _POOL
+
+def stop_encoder_pool():
+    global _POOL
+    if _POOL is not None:
+        embedder.set_encoder_pool(None)
+        _POOL.stop()
+        _POOL = None
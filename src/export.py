@@ -0,0 +1,300 @@
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+import numpy as np
+import orjson
+from bson import ObjectId, json_util
+from dotenv import load_dotenv
+from src.embedder import SECTION_NAMES, VECTOR_DIMENSION
+from src.vector_codec import decode_section
+from src.responses import pack_vector
+
+load_dotenv()
+
+# Documents fetched per cursor batch while exporting
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+# Jobs per exported shard file
+EXPORT_SHARD_ROWS = int(os.getenv("EXPORT_SHARD_ROWS", "100000"))
+
+# Export file formats:
+#   npy   - per shard, one (rows, dim) float32 .npy per section, plus
+#           <shard>.ids.npy (job_id per row) and <shard>.present.npy
+#           (rows, sections) flags for rows that have each vector
+#   arrow - one Arrow IPC file per shard with _id, job_id and a
+#           fixed-size float32 list column per section (null if missing)
+EXPORT_FORMATS = ("npy", "arrow")
+
+MANIFEST_NAME = "manifest.json"
+
+class ExportBatch:
+    """
+    One cursor batch of exported jobs: `vectors[section]` is a (rows, dim)
+    float32 matrix with zero rows where `present[section]` is False.
+    `keys` are the raw _id values, `ids` their string forms.
+    """
+    __slots__ = ("keys", "ids", "job_ids", "vectors", "present")
+
+    def __init__(self, keys: List[Any], ids: List[str], job_ids: List[str], vectors: Dict[str, np.ndarray], present: Dict[str, np.ndarray]):
+        self.keys = keys
+        self.ids = ids
+        self.job_ids = job_ids
+        self.vectors = vectors
+        self.present = present
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+def parse_sections(text: Optional[str]) -> List[str]:
+    if not text:
+        return list(SECTION_NAMES)
+    sections = [section.strip() for section in text.split(",") if section.strip()]
+    unknown = [section for section in sections if section not in SECTION_NAMES]
+    if unknown or not sections:
+        raise ValueError(f"Unknown sections {unknown}. Expected some of {SECTION_NAMES}")
+    return sections
+
+def export_projection(sections: List[str]) -> Dict[str, int]:
+    # Only the stored vector fields; section text and cleaned_job stay on the server
+    projection = {"job_id": 1}
+    for section in sections:
+        for field in ("vector", "vector_format", "vector_scale", "vector_dim"):
+            projection[f"embeddings.{section}.{field}"] = 1
+    return projection
+
+def batch_from_documents(docs: List[Dict[str, Any]], sections: List[str], dim: int = VECTOR_DIMENSION) -> ExportBatch:
+    vectors = {section: np.zeros((len(docs), dim), dtype=np.float32) for section in sections}
+    present = {section: np.zeros(len(docs), dtype=bool) for section in sections}
+    for row, doc in enumerate(docs):
+        embeddings = doc.get("embeddings") or {}
+        for section in sections:
+            vector = decode_section(embeddings.get(section))
+            if vector is not None:
+                vectors[section][row] = vector
+                present[section][row] = True
+    return ExportBatch(
+        [doc["_id"] for doc in docs],
+        [str(doc["_id"]) for doc in docs],
+        [doc.get("job_id") or str(doc["_id"]) for doc in docs],
+        vectors,
+        present
+    )
+
+async def iter_export_batches(collection, sections: List[str], after=None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[ExportBatch]:
+    """
+    Streams embedded jobs in _id order, batch_size documents at a time,
+    from a single cursor with a vectors-only projection. Pass the last
+    exported _id as `after` to resume.
+    """
+    query: Dict[str, Any] = {"metadata.embedding_ready": True}
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    cursor = collection.find(query, export_projection(sections), batch_size=batch_size).sort("_id", 1)
+    while True:
+        docs = await cursor.to_list(length=batch_size)
+        if not docs:
+            break
+        yield batch_from_documents(docs, sections)
+
+def arrow_schema(sections: List[str], dim: int = VECTOR_DIMENSION):
+    import pyarrow as pa
+    return pa.schema(
+        [("_id", pa.string()), ("job_id", pa.string())]
+        + [(section, pa.list_(pa.float32(), dim)) for section in sections]
+    )
+
+def arrow_record_batch(batch: ExportBatch, schema):
+    import pyarrow as pa
+    columns = [pa.array(batch.ids, pa.string()), pa.array(batch.job_ids, pa.string())]
+    for field in schema:
+        if field.name in batch.vectors:
+            matrix = batch.vectors[field.name]
+            columns.append(pa.FixedSizeListArray.from_arrays(
+                pa.array(matrix.reshape(-1), pa.float32()),
+                type=field.type,
+                mask=pa.array(~batch.present[field.name])
+            ))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+class NpyShardWriter:
+    """
+    Fills one shard's section matrices through memory-mapped .npy files,
+    so memory use does not grow with the shard size.
+    """
+
+    def __init__(self, path: str, sections: List[str], capacity: int, dim: int = VECTOR_DIMENSION):
+        self.path = path
+        self.sections = sections
+        self.capacity = capacity
+        self.rows = 0
+        self.job_ids: List[str] = []
+        self.present = np.zeros((capacity, len(sections)), dtype=bool)
+        self.matrices = {
+            section: np.lib.format.open_memmap(f"{path}.{section}.npy.tmp", mode="w+", dtype=np.float32, shape=(capacity, dim))
+            for section in sections
+        }
+
+    def write(self, batch: ExportBatch, start: int, stop: int):
+        count = stop - start
+        for column, section in enumerate(self.sections):
+            self.matrices[section][self.rows:self.rows + count] = batch.vectors[section][start:stop]
+            self.present[self.rows:self.rows + count, column] = batch.present[section][start:stop]
+        self.job_ids.extend(batch.job_ids[start:stop])
+        self.rows += count
+
+    def close(self) -> List[str]:
+        files = []
+        for section in self.sections:
+            matrix = self.matrices.pop(section)
+            final_path = f"{self.path}.{section}.npy"
+            matrix.flush()
+            if self.rows == self.capacity:
+                del matrix
+                os.replace(f"{final_path}.tmp", final_path)
+            else:
+                # Last shard: copy the filled rows into a file of the exact shape
+                trimmed = np.lib.format.open_memmap(final_path, mode="w+", dtype=np.float32, shape=(self.rows, matrix.shape[1]))
+                trimmed[:] = matrix[:self.rows]
+                trimmed.flush()
+                del trimmed, matrix
+                os.remove(f"{final_path}.tmp")
+            files.append(os.path.basename(final_path))
+        np.save(f"{self.path}.ids.npy", np.array(self.job_ids, dtype=str))
+        np.save(f"{self.path}.present.npy", self.present[:self.rows])
+        return files + [os.path.basename(f"{self.path}.ids.npy"), os.path.basename(f"{self.path}.present.npy")]
+
+class ArrowShardWriter:
+    def __init__(self, path: str, sections: List[str], capacity: int, dim: int = VECTOR_DIMENSION):
+        import pyarrow as pa
+        self.path = path
+        self.capacity = capacity
+        self.rows = 0
+        self.schema = arrow_schema(sections, dim)
+        self._sink = pa.OSFile(f"{path}.arrow.tmp", "wb")
+        self._writer = pa.ipc.new_file(self._sink, self.schema)
+
+    def write(self, batch: ExportBatch, start: int, stop: int):
+        self._writer.write_batch(arrow_record_batch(batch, self.schema).slice(start, stop - start))
+        self.rows += stop - start
+
+    def close(self) -> List[str]:
+        self._writer.close()
+        self._sink.close()
+        os.replace(f"{self.path}.arrow.tmp", f"{self.path}.arrow")
+        return [os.path.basename(f"{self.path}.arrow")]
+
+SHARD_WRITERS = {"npy": NpyShardWriter, "arrow": ArrowShardWriter}
+
+class ExportManifest:
+    """
+    manifest.json of an export directory: what was exported and the last
+    _id of every finished shard. Rewritten atomically after each shard,
+    so an interrupted export resumes after the last finished one. The
+    resume point is kept as extended JSON, so it round-trips whatever the
+    _id type is.
+    """
+
+    def __init__(self, directory: str, fmt: str, sections: List[str], dim: int = VECTOR_DIMENSION):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.state = {"format": fmt, "sections": sections, "dim": dim, "rows": 0, "last_id": None, "after": None, "shards": []}
+
+    def load(self) -> "ExportManifest":
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            for key in ("format", "sections", "dim"):
+                if state[key] != self.state[key]:
+                    raise ValueError(f"{self.path} was written with {key}={state[key]!r}; pass --restart to export again")
+            self.state = state
+        return self
+
+    @property
+    def last_id(self) -> Optional[str]:
+        return self.state["last_id"]
+
+    @property
+    def after(self) -> Any:
+        if "after" in self.state:
+            return json_util.loads(json.dumps(self.state["after"]))
+        # Manifests written before "after" was recorded only hold ObjectId hex strings
+        return ObjectId(self.state["last_id"]) if self.state["last_id"] else None
+
+    @property
+    def rows(self) -> int:
+        return self.state["rows"]
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.state["shards"])
+
+    def add_shard(self, files: List[str], rows: int, last_key: Any):
+        last_id = str(last_key)
+        self.state["shards"].append({"files": files, "rows": rows, "last_id": last_id})
+        self.state["rows"] += rows
+        self.state["last_id"] = last_id
+        self.state["after"] = json.loads(json_util.dumps(last_key))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+async def export_to_directory(collection, directory: str, fmt: str, sections: List[str], shard_rows: int = EXPORT_SHARD_ROWS, batch_size: int = EXPORT_BATCH_SIZE, on_shard=None) -> ExportManifest:
+    """
+    Writes every embedded job's vectors to shard files under `directory`,
+    continuing after the last shard recorded in its manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = ExportManifest(directory, fmt, sections).load()
+    after = manifest.after
+    writer_class = SHARD_WRITERS[fmt]
+
+    writer = None
+    async for batch in iter_export_batches(collection, sections, after, batch_size):
+        start = 0
+        while start < len(batch):
+            if writer is None:
+                name = f"shard-{manifest.shard_count:05d}"
+                writer = writer_class(os.path.join(directory, name), sections, shard_rows)
+            stop = min(len(batch), start + writer.capacity - writer.rows)
+            writer.write(batch, start, stop)
+            if writer.rows == writer.capacity:
+                manifest.add_shard(writer.close(), writer.rows, batch.keys[stop - 1])
+                writer = None
+                if on_shard is not None:
+                    on_shard(manifest)
+            start = stop
+        last_key = batch.keys[-1]
+
+    if writer is not None and writer.rows:
+        manifest.add_shard(writer.close(), writer.rows, last_key)
+        if on_shard is not None:
+            on_shard(manifest)
+    return manifest
+
+# Formats GET /export can stream:
+#   ndjson - one {"_id", "job_id", <section>: base64 float32 | null} per line
+#   arrow  - Arrow IPC stream, one record batch per cursor batch
+EXPORT_STREAM_FORMATS = ("ndjson", "arrow")
+
+# End-of-stream marker of the Arrow IPC streaming format
+ARROW_STREAM_END = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+async def stream_export(collection, sections: List[str], fmt: str, after=None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """
+    Response body for GET /export: one chunk per cursor batch.
+    """
+    if fmt == "arrow":
+        schema = arrow_schema(sections)
+        yield schema.serialize().to_pybytes()
+        async for batch in iter_export_batches(collection, sections, after, batch_size):
+            yield arrow_record_batch(batch, schema).serialize().to_pybytes()
+        yield ARROW_STREAM_END
+        return
+
+    async for batch in iter_export_batches(collection, sections, after, batch_size):
+        lines = []
+        for row in range(len(batch)):
+            line = {"_id": batch.ids[row], "job_id": batch.job_ids[row]}
+            for section in sections:
+                line[section] = pack_vector(batch.vectors[section][row], "b64") if batch.present[section][row] else None
+            lines.append(orjson.dumps(line, option=orjson.OPT_APPEND_NEWLINE))
+        yield b"".join(lines)
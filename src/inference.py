@@ -0,0 +1,69 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Threads that run model inference off the event loop
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+# Requests allowed to wait for or run inference at the same time
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", "64"))
+# Seconds clients are told to back off when the service is saturated
+OVERLOAD_RETRY_AFTER_S = int(os.getenv("OVERLOAD_RETRY_AFTER_S", "1"))
+
+_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+class OverloadedError(Exception):
+    def __init__(self, retry_after: int = OVERLOAD_RETRY_AFTER_S):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+async def run_inference(fn, *args, **kwargs):
+    """
+    Runs a blocking model call on the bounded inference executor so the
+    event loop keeps serving requests, the watcher and Mongo I/O meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+def shutdown_inference():
+    _executor.shutdown(wait=True, cancel_futures=True)
+
+class AdmissionController:
+    """
+    Bounds the number of in-flight inference requests.
+    Requests beyond the limit are rejected immediately instead of queueing,
+    so latency stays bounded under overload.
+    """
+
+    def __init__(self, limit: int = MAX_INFLIGHT_REQUESTS):
+        self.limit = limit
+        self.inflight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self):
+        if self.inflight >= self.limit:
+            self.rejected += 1
+            raise OverloadedError()
+        self.inflight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": INFERENCE_WORKERS,
+            "limit": self.limit,
+            "inflight": self.inflight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+admission = AdmissionController()
@@ -0,0 +1,90 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.schemas import Embeddings, EmbeddingData, JobData, JobOutput, Metadata
+
+# Section order of the rows in every JobEmbeddings matrix
+SECTIONS = list(Embeddings.model_fields)
+
+class SectionVector:
+    __slots__ = ("text", "vector")
+
+    def __init__(self, text: Optional[str], vector: Optional[np.ndarray]):
+        self.text = text
+        self.vector = vector
+
+class JobEmbeddings:
+    """
+    Internal embeddings of one job.
+
+    `matrix` is a (n_sections, dim) float32 view into the matrix of the
+    whole batch it was encoded with, rows in SECTIONS order; `present`
+    flags the rows that hold a vector (the others are zero). Vectors stay
+    NumPy until an output boundary: to_model() for the Pydantic schema,
+    vector_codec.encode_job_embeddings() for MongoDB. Sections are also
+    readable as attributes (embeddings.title.vector) like the model.
+    """
+    __slots__ = ("texts", "matrix", "present")
+
+    def __init__(self, texts: Tuple[Optional[str], ...], matrix: np.ndarray, present: np.ndarray):
+        self.texts = texts
+        self.matrix = matrix
+        self.present = present
+
+    def vector(self, section: str) -> Optional[np.ndarray]:
+        row = SECTIONS.index(section)
+        return self.matrix[row] if self.present[row] else None
+
+    def text(self, section: str) -> Optional[str]:
+        return self.texts[SECTIONS.index(section)]
+
+    def __getattr__(self, name: str) -> SectionVector:
+        if name in SECTIONS:
+            return SectionVector(self.text(name), self.vector(name))
+        raise AttributeError(name)
+
+    @property
+    def sections_embedded(self) -> List[str]:
+        return [section for section, present in zip(SECTIONS, self.present) if present]
+
+    def to_model(self) -> Embeddings:
+        return Embeddings(**{
+            section: EmbeddingData(
+                text=self.texts[row],
+                vector=self.matrix[row].tolist() if self.present[row] else None
+            )
+            for row, section in enumerate(SECTIONS)
+        })
+
+class EmbeddedJob:
+    """
+    A normalized, embedded job on its way to MongoDB and the response.
+    Same fields as JobOutput, without validating the vectors into lists.
+    """
+    __slots__ = ("job_id", "cleaned_job", "embeddings", "metadata")
+
+    def __init__(self, job_id: str, cleaned_job: JobData, embeddings: JobEmbeddings, metadata: Metadata):
+        self.job_id = job_id
+        self.cleaned_job = cleaned_job
+        self.embeddings = embeddings
+        self.metadata = metadata
+
+    def to_output(self) -> JobOutput:
+        return JobOutput(
+            job_id=self.job_id,
+            cleaned_job=self.cleaned_job,
+            embeddings=self.embeddings.to_model(),
+            metadata=self.metadata
+        )
+
+def batch_embeddings(section_texts: List[Dict[str, Optional[str]]], vectors, dim: int) -> List[JobEmbeddings]:
+    """
+    Scatters a flat (n_texts, dim) array into one (n_jobs, n_sections, dim)
+    batch matrix and returns a JobEmbeddings view per job.
+    """
+    texts = [tuple(job_texts[section] for section in SECTIONS) for job_texts in section_texts]
+    present = np.array([[bool(text) for text in job_texts] for job_texts in texts], dtype=bool).reshape(len(texts), len(SECTIONS))
+    matrix = np.zeros((len(texts), len(SECTIONS), dim), dtype=np.float32)
+    if present.any():
+        # Row-major order of present matches the order the texts were encoded in
+        matrix[present] = np.asarray(vectors, dtype=np.float32)
+    return [JobEmbeddings(texts[i], matrix[i], present[i]) for i in range(len(texts))]
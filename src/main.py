@@ -1,13 +1,34 @@
-from fastapi import FastAPI, Body, Depends, HTTPException, Security, status
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request, Security, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from bson import ObjectId
 from fastapi.security import APIKeyHeader
-from src.normalizer import normalize_job
-from src.embedder import generate_embeddings, get_metadata
-from src.schemas import JobOutput
-from src.database import connect_to_mongo, close_mongo_connection, save_job
+from src.normalizer import normalize_job, resolution_plan
+from src.embedder import get_metadata, get_cache, get_skill_vocabulary, get_padding_stats, warm_up_model, SECTION_NAMES
+from src.batcher import batcher
+from src.inference import admission, OverloadedError, shutdown_inference, run_inference
+from src.encoder_pool import start_encoder_pool, stop_encoder_pool
+from src.responses import negotiate_format, render_job_output
+from src.job_vectors import EmbeddedJob
+from src.bulk import stream_results, DuplexStreamingResponse
+from src.dedup import embed_deduplicated, get_duplicate_index
+from src.export import parse_sections, stream_export, EXPORT_STREAM_FORMATS
+from src.schemas import JobOutput, SearchRequest, SearchResponse, SearchHit, MatchRequest, MatchResponse, MatchHit
+from src import database
+from src.database import connect_to_mongo, close_mongo_connection, save_job, COLLECTION_NAME
+from src.write_buffer import write_buffer
 from src.watcher import watch_and_embed
+from src.vector_index import (
+    SEARCH_ENABLED, SEARCH_SYNC_INTERVAL_S, MATCH_WEIGHTS, FILTER_FIELDS, open_snapshot, close_snapshot, get_snapshot, get_ann_indexes,
+    sync_snapshot, parse_weights
+)
+from src.ann import ANN_NPROBE
+import importlib.util
 import uuid
 import os
-import uvicorn
+from contextlib import ExitStack
+from typing import Optional
+import time
 import asyncio
 from dotenv import load_dotenv
 
@@ -15,6 +36,9 @@ load_dotenv()
 
 app = FastAPI(title="Conductor Job Embedding Service")
 
+# Readiness state reported by /ready; phase timings are in seconds
+startup_state = {"ready": False, "error": None, "phases": {}}
+
 # Security Configuration
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=True)
@@ -37,18 +61,88 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
         )
     return api_key_header
 
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    # Shed load early so queued requests keep a bounded latency
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service is at capacity, retry later"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+async def timed_phase(name: str, coro):
+    started = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - started
+    startup_state["phases"][name] = round(elapsed, 3)
+    print(f"[Startup] {name}: {elapsed:.2f}s")
+    return result
+
+async def warm_up():
+    """
+    Loads and warms the model in the background so the port opens
+    immediately while /ready keeps traffic away until inference is fast.
+    """
+    try:
+        # Spawn encoder worker processes when ENCODER_PROCESSES > 0
+        await timed_phase("encoder_pool", run_inference(start_encoder_pool))
+        await timed_phase("model_warm_up", run_inference(warm_up_model))
+        startup_state["ready"] = True
+        print(f"[Startup] Ready in {sum(startup_state['phases'].values()):.2f}s")
+    except Exception as e:
+        startup_state["error"] = str(e)
+        print(f"❌ [Startup] Model warm-up failed: {e}")
+
+async def keep_snapshot_synced():
+    """
+    Pulls vectors written by other processes (ingest runs, other replicas)
+    into this process's search snapshot.
+    """
+    while True:
+        try:
+            await sync_snapshot(get_snapshot(), database.db[COLLECTION_NAME])
+            # Train ANN indexes once enough vectors are in the snapshot, and
+            # persist changed ones (rate-limited) off the event loop
+            if get_ann_indexes() is not None:
+                await asyncio.to_thread(get_ann_indexes().train_missing)
+                await asyncio.to_thread(get_ann_indexes().save)
+        except Exception as e:
+            print(f"❌ [Search] Snapshot sync failed: {e}")
+        await asyncio.sleep(SEARCH_SYNC_INTERVAL_S)
+
 @app.on_event("startup")
 async def startup_db_client():
-    await connect_to_mongo()
+    await timed_phase("mongo_connect", connect_to_mongo())
+    # Start the request coalescer in front of the model
+    batcher.start()
+    asyncio.create_task(warm_up())
     # Start the background watcher
     asyncio.create_task(watch_and_embed())
+    # Open the search snapshot and keep it in sync with the collection
+    if SEARCH_ENABLED:
+        open_snapshot()
+        asyncio.create_task(keep_snapshot_synced())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await batcher.stop()
+    shutdown_inference()
+    stop_encoder_pool()
     await close_mongo_connection()
+    close_snapshot()
+    if get_skill_vocabulary() is not None:
+        get_skill_vocabulary().close()
 
 @app.post("/process", response_model=JobOutput, dependencies=[Depends(get_api_key)])
-async def process_job(payload: dict = Body(...)):
+async def process_job(
+    request: Request,
+    payload: dict = Body(...),
+    response_format: Optional[str] = Query(None, alias="format"),
+    include_vectors: bool = True
+):
+    # Wire format for the response: ?format= or the Accept header (json, b64, msgpack)
+    fmt = negotiate_format(response_format, request.headers.get("accept"))
+    
     # Extract ID or generate
     # We look for common ID fields or generate one
     job_id = payload.get("job_id") or payload.get("id") or str(uuid.uuid4())
@@ -56,13 +150,16 @@ async def process_job(payload: dict = Body(...)):
     # 1. Normalize
     canonical_job = normalize_job(payload, job_id)
     
-    # 2. Embed
-    embeddings = generate_embeddings(canonical_job.job_data)
+    # 2. Embed (coalesced with concurrent requests into one encode call)
+    # Rejected with 503 + Retry-After when too many requests are in flight
+    # A near-duplicate of a recent job reuses its vectors (DEDUP_ENABLED)
+    with admission.slot():
+        embeddings, duplicate_of = (await embed_deduplicated([canonical_job], batcher.embed_jobs))[0]
     
     # 3. Metadata
-    metadata = get_metadata(embeddings)
+    metadata = get_metadata(embeddings, duplicate_of)
     
-    job_output = JobOutput(
+    job = EmbeddedJob(
         job_id=job_id,
         cleaned_job=canonical_job.job_data,
         embeddings=embeddings,
@@ -70,9 +167,204 @@ async def process_job(payload: dict = Body(...)):
     )
     
     # 4. Save to DB
-    await save_job(job_output)
+    await save_job(job)
+    
+    # 5. Serialize straight from the NumPy vectors (response_model only documents the shape)
+    return render_job_output(job, fmt, include_vectors)
+
+@app.post("/process/batch", dependencies=[Depends(get_api_key)])
+async def process_jobs_stream(
+    request: Request,
+    response_format: Optional[str] = Query(None, alias="format"),
+    include_vectors: bool = False
+):
+    """
+    Body: NDJSON (one job per line) or a JSON array of jobs. Responds with
+    NDJSON, one line per job in input order: {"index", "job_id", "status":
+    "ok" | "invalid" | "failed", ...}. Jobs are embedded and saved in
+    batches while the body is still being read.
+    """
+    fmt = negotiate_format(response_format, None)
+    if fmt == "msgpack":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="/process/batch streams NDJSON; use format=json or b64")
+    
+    # One admission slot for the whole stream, released however the response ends
+    slot = ExitStack()
+    slot.enter_context(admission.slot())
+    body_read = asyncio.Event()
+    return DuplexStreamingResponse(
+        stream_results(request.stream(), fmt, include_vectors, body_read),
+        body_read,
+        media_type="application/x-ndjson",
+        background=BackgroundTask(slot.close)
+    )
+
+def check_filters(filters):
+    unknown = [field for field in filters if field not in FILTER_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot filter on {unknown}. Filterable fields: {FILTER_FIELDS}"
+        )
+
+@app.post("/search", response_model=SearchResponse, dependencies=[Depends(get_api_key)])
+async def search_jobs(request: SearchRequest):
+    snapshot = get_snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Search is not enabled")
+    if request.section not in SECTION_NAMES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown section '{request.section}'. Expected one of {SECTION_NAMES}"
+        )
+    check_filters(request.filters)
+    
+    started = time.perf_counter()
+    
+    # 1. Embed the query like a section of that kind
+    with admission.slot():
+        query_vector = (await batcher.encode([(request.section, request.query)]))[0]
+    
+    # 2. Score against the ANN index or the exact snapshot, off the event loop.
+    #    Filters already shrink the candidate set, so filtered searches score
+    #    the matching rows exactly.
+    ann = get_ann_indexes()
+    index = ann.get(request.section) if ann is not None else None
+    if request.mode == "ann" and (index is None or request.filters):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"No ANN index trained for '{request.section}' yet" if index is None else "ANN mode does not support filters"
+        )
+    mode = "exact" if index is None or request.mode == "exact" or request.filters else "ann"
+    if mode == "ann":
+        ranked = await asyncio.to_thread(ann.search, request.section, query_vector, request.top_k, request.nprobe or ANN_NPROBE)
+    else:
+        ranked = await asyncio.to_thread(snapshot.search, query_vector, request.section, request.top_k, request.filters)
     
-    return job_output
+    hits = [
+        SearchHit(
+            job_id=snapshot.job_ids[row],
+            score=score,
+            title=snapshot.fields[row].get("title"),
+            location=snapshot.fields[row].get("location")
+        )
+        for row, score in ranked
+    ]
+    return SearchResponse(
+        section=request.section,
+        mode=mode,
+        total_jobs=snapshot.count,
+        took_ms=round((time.perf_counter() - started) * 1000, 3),
+        hits=hits
+    )
+
+@app.post("/match", response_model=MatchResponse, dependencies=[Depends(get_api_key)])
+async def match_jobs(request: MatchRequest):
+    snapshot = get_snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Search is not enabled")
+    if (request.job is None) == (request.job_id is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Provide exactly one of 'job' or 'job_id'")
+
+    weights = {**parse_weights(MATCH_WEIGHTS), **request.weights}
+    unknown = [section for section in weights if section not in SECTION_NAMES]
+    if unknown or any(weight < 0 for weight in weights.values()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Weights must be non-negative and keyed by {SECTION_NAMES}"
+        )
+    check_filters(request.filters)
+
+    started = time.perf_counter()
+
+    # 1. Query vectors: a stored job's rows, or the given job/profile embedded per section
+    exclude_row = None
+    if request.job_id is not None:
+        exclude_row = snapshot.rows.get(request.job_id)
+        if exclude_row is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job '{request.job_id}' is not in the search snapshot")
+        query_vectors = snapshot.row_vectors(exclude_row)
+    else:
+        canonical_job = normalize_job(request.job, "match-query")
+        with admission.slot():
+            embeddings = (await batcher.embed_jobs([canonical_job.job_data]))[0]
+        query_vectors = {section: embeddings.vector(section) for section in SECTION_NAMES}
+
+    # 2. Score every section and fuse off the event loop
+    ranked = await asyncio.to_thread(snapshot.match, query_vectors, weights, request.top_k, exclude_row, request.filters)
+
+    hits = [
+        MatchHit(
+            job_id=snapshot.job_ids[row],
+            score=score,
+            sections=sections,
+            title=snapshot.fields[row].get("title"),
+            location=snapshot.fields[row].get("location")
+        )
+        for row, score, sections in ranked
+    ]
+    return MatchResponse(
+        weights=weights,
+        total_jobs=snapshot.count,
+        took_ms=round((time.perf_counter() - started) * 1000, 3),
+        hits=hits
+    )
+
+@app.get("/export", dependencies=[Depends(get_api_key)])
+async def export_embeddings(
+    sections: Optional[str] = None,
+    response_format: str = Query("ndjson", alias="format"),
+    after: Optional[str] = None
+):
+    """
+    Streams the stored vectors of every embedded job in _id order, one
+    cursor batch per chunk. `sections` is a comma-separated subset; pass
+    the last received _id as `after` to resume an interrupted export.
+    """
+    try:
+        export_sections = parse_sections(sections)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if response_format not in EXPORT_STREAM_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown format '{response_format}'. Expected one of {EXPORT_STREAM_FORMATS}"
+        )
+    if response_format == "arrow" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Arrow exports need the pyarrow package installed")
+    if after is not None and not ObjectId.is_valid(after):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"'after' must be an ObjectId, got '{after}'")
+
+    return StreamingResponse(
+        stream_export(database.db[COLLECTION_NAME], export_sections, response_format, ObjectId(after) if after else None),
+        media_type="application/vnd.apache.arrow.stream" if response_format == "arrow" else "application/x-ndjson"
+    )
+
+@app.get("/ready")
+async def ready():
+    # Render health check: 503 until the model is loaded and warmed up
+    if not startup_state["ready"]:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"ready": False, "error": startup_state["error"], "phases": startup_state["phases"]}
+        )
+    return {"ready": True, "phases": startup_state["phases"]}
+
+@app.get("/stats", dependencies=[Depends(get_api_key)])
+async def get_stats():
+    return {
+        "batcher": batcher.stats(),
+        "admission": admission.stats(),
+        "cache": get_cache().stats() if get_cache() else None,
+        "skill_vocabulary": get_skill_vocabulary().stats() if get_skill_vocabulary() else None,
+        "padding": get_padding_stats(),
+        "normalizer_plans": resolution_plan.cache_info()._asdict(),
+        "dedup": get_duplicate_index().stats() if get_duplicate_index() else None,
+        "write_buffer": write_buffer.stats(),
+        "ann": get_ann_indexes().stats() if get_ann_indexes() else None,
+        "filter_values": get_snapshot().field_index.stats() if get_snapshot() else None
+    }
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
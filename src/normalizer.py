@@ -1,5 +1,6 @@
 import re
-from typing import List, Optional, Any, Dict
+from functools import lru_cache
+from typing import List, Optional, Any, Dict, Tuple, Union
 from src.schemas import CanonicalJob, JobData, JobSections
 
 def clean_string(text: Any) -> Optional[str]:
@@ -38,47 +39,76 @@ def clean_list(items: Any) -> List[str]:
             
     return cleaned_items
 
-def get_first_value(data: Dict, keys: List[str]) -> Any:
-    # Helper to normalize a key for comparison (lowercase, remove non-alphanumeric)
-    def normalize_key(k: str) -> str:
-        return re.sub(r'[^a-z0-9]', '', str(k).lower())
+# Candidate source keys per canonical field, in priority order.
+# Mappings - refined for LinkedIn & Naukri Schemas
+# Naukri: "Job Title", "Key Skills", "Job Experience Required", "joblocation_address", "Uniq Id"
+FIELD_KEYS = {
+    "title": ["title", "job_title", "role", "position", "job title"],
+    "company": ["company_name", "company", "employer"],
+    "location": ["location", "city", "place", "joblocation_address", "job location"],
+    "employment_type": ["formatted_work_type", "work_type", "employment_type"],
+    "experience_required": ["formatted_experience_level", "experience_required", "experience", "job experience required"],
+    "required_skills": ["skills_desc", "required_skills", "skills", "key skills"],
+    "responsibilities": ["responsibilities", "duties"],
+    "qualifications": ["qualifications", "requirements", "education"],
+    "description": ["description", "job_description", "job description"],
+}
 
-    # Create a map of normalized data keys to original keys
-    normalized_data_keys = {normalize_key(k): k for k in data.keys()}
-    
-    for key in keys:
-        norm_key = normalize_key(key)
-        if norm_key in normalized_data_keys:
-            return data[normalized_data_keys[norm_key]]
-    return None
+# Raw ID fields that override the job_id passed to normalize_job
+ID_KEYS = ["uniq_id", "jobid"]
+
+def normalize_key(k: Any) -> str:
+    # Normalize a key for comparison (lowercase, remove non-alphanumeric)
+    return re.sub(r'[^a-z0-9]', '', str(k).lower())
+
+NORMALIZED_FIELD_KEYS = {field: [normalize_key(key) for key in keys] for field, keys in FIELD_KEYS.items()}
+
+@lru_cache(maxsize=1024)
+def resolution_plan(keys: Tuple) -> Tuple[Optional[str], Dict[str, Optional[Any]]]:
+    """
+    Resolves, once per key signature (the raw dict's keys in order), which
+    ID key overrides the job_id and which source key feeds each canonical
+    field. Feeds come in a handful of shapes, so after the first job of a
+    shape every field is a direct dict lookup.
+    """
+    normalized_data_keys = {normalize_key(k): k for k in keys}
+    id_key = next((key for key in ID_KEYS if key in keys), None)
+    sources = {}
+    for field, candidates in NORMALIZED_FIELD_KEYS.items():
+        sources[field] = next(
+            (normalized_data_keys[candidate] for candidate in candidates if candidate in normalized_data_keys),
+            None
+        )
+    return id_key, sources
 
 def normalize_job(raw_data: Dict, job_id: str) -> CanonicalJob:
-    # Mappings - refined for LinkedIn & Naukri Schemas
-    # Naukri: "Job Title", "Key Skills", "Job Experience Required", "joblocation_address", "Uniq Id"
-    
+    id_key, sources = resolution_plan(tuple(raw_data.keys()))
+
+    def value(field: str) -> Any:
+        source = sources[field]
+        return raw_data[source] if source is not None else None
+
     # ID fallback if passed explicitly in raw_data and job_id is just a uuid
-    if "uniq_id" in raw_data:
-        job_id = str(raw_data["uniq_id"])
-    elif "jobid" in raw_data:
-        job_id = str(raw_data["jobid"])
+    if id_key is not None:
+        job_id = str(raw_data[id_key])
 
-    title = clean_string(get_first_value(raw_data, ["title", "job_title", "role", "position", "job title"]))
+    title = clean_string(value("title"))
     
-    company = clean_string(get_first_value(raw_data, ["company_name", "company", "employer"]))
+    company = clean_string(value("company"))
     
-    location = clean_string(get_first_value(raw_data, ["location", "city", "place", "joblocation_address", "job location"]))
+    location = clean_string(value("location"))
     
-    employment_type = clean_string(get_first_value(raw_data, ["formatted_work_type", "work_type", "employment_type"]))
+    employment_type = clean_string(value("employment_type"))
     
-    experience_required = clean_string(get_first_value(raw_data, ["formatted_experience_level", "experience_required", "experience", "job experience required"]))
+    experience_required = clean_string(value("experience_required"))
     
     # Sections
-    required_skills = clean_list(get_first_value(raw_data, ["skills_desc", "required_skills", "skills", "key skills"]))
+    required_skills = clean_list(value("required_skills"))
     
-    responsibilities = clean_list(get_first_value(raw_data, ["responsibilities", "duties"]))
-    qualifications = clean_list(get_first_value(raw_data, ["qualifications", "requirements", "education"]))
+    responsibilities = clean_list(value("responsibilities"))
+    qualifications = clean_list(value("qualifications"))
     
-    description = clean_string(get_first_value(raw_data, ["description", "job_description", "job description"]))
+    description = clean_string(value("description"))
 
     sections = JobSections(
         required_skills=required_skills,
@@ -97,3 +127,17 @@ def normalize_job(raw_data: Dict, job_id: str) -> CanonicalJob:
     )
 
     return CanonicalJob(job_id=job_id, job_data=job_data)
+
+def normalize_jobs(raw_docs: List[Dict], job_ids: List[str]) -> List[Union[CanonicalJob, Exception]]:
+    """
+    Batch entry point for the bulk paths (ingest, watcher). A row that
+    fails to normalize is returned as its exception, in place, so one bad
+    row does not fail the batch.
+    """
+    results = []
+    for raw_data, job_id in zip(raw_docs, job_ids):
+        try:
+            results.append(normalize_job(raw_data, job_id))
+        except Exception as e:
+            results.append(e)
+    return results
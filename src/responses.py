@@ -0,0 +1,104 @@
+import base64
+import importlib.util
+from typing import Any, Dict, Optional
+import numpy as np
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from src.job_vectors import EmbeddedJob, SECTIONS
+
+# Wire formats for vectors in /process responses:
+#   json    - vectors as JSON float arrays (default)
+#   b64     - JSON, each vector as base64 of little-endian float32 bytes
+#   msgpack - MessagePack, each vector as raw float32 bytes
+RESPONSE_FORMATS = ("json", "b64", "msgpack")
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+B64_MEDIA_TYPE = "application/vnd.conductor.b64+json"
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered with orjson, which also serializes NumPy arrays
+    directly.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        import msgpack
+        return msgpack.packb(content, use_bin_type=True)
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """
+    Picks the response format: an explicit ?format= wins, then the Accept
+    header, then plain JSON. Checked before any work is done, so an
+    unusable format fails the request up front.
+    """
+    fmt = _requested_format(requested, accept)
+    if fmt == "msgpack" and importlib.util.find_spec("msgpack") is None:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail="MessagePack responses need the msgpack package installed"
+        )
+    return fmt
+
+def _requested_format(requested: Optional[str], accept: Optional[str]) -> str:
+    if requested is not None:
+        if requested not in RESPONSE_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown format '{requested}'. Expected one of {RESPONSE_FORMATS}"
+            )
+        return requested
+
+    for media_type in (accept or "").split(","):
+        media_type = media_type.split(";")[0].strip().lower()
+        if media_type in MSGPACK_MEDIA_TYPES:
+            return "msgpack"
+        if media_type == B64_MEDIA_TYPE:
+            return "b64"
+    return "json"
+
+def pack_vector(vector: Optional[np.ndarray], fmt: str):
+    # orjson writes float32 arrays as JSON numbers directly
+    if vector is None or fmt == "json":
+        return vector
+    packed = np.asarray(vector, dtype="<f4").tobytes()
+    return base64.b64encode(packed).decode("ascii") if fmt == "b64" else packed
+
+def job_output_content(job: EmbeddedJob, fmt: str = "json", include_vectors: bool = True) -> Dict[str, Any]:
+    """
+    JobOutput-shaped content built from the NumPy vectors; they are only
+    converted to the wire format here.
+    """
+    embeddings = {}
+    for row, section_name in enumerate(SECTIONS):
+        section = {"text": job.embeddings.texts[row]}
+        if include_vectors:
+            vector = job.embeddings.vector(section_name)
+            section["vector"] = pack_vector(vector, fmt)
+            if vector is not None and fmt != "json":
+                section["vector_format"] = "float32"
+        embeddings[section_name] = section
+    return {
+        "job_id": job.job_id,
+        "cleaned_job": job.cleaned_job.model_dump(),
+        "embeddings": embeddings,
+        "metadata": job.metadata.model_dump()
+    }
+
+def render_job_output(job: EmbeddedJob, fmt: str = "json", include_vectors: bool = True) -> Response:
+    """
+    Serializes an embedded job without a Pydantic pass over its vectors.
+    """
+    content = job_output_content(job, fmt, include_vectors)
+    if fmt == "msgpack":
+        return MsgPackResponse(content)
+    if fmt == "b64":
+        return FastJSONResponse(content, media_type=B64_MEDIA_TYPE)
+    return FastJSONResponse(content)
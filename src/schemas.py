@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict
+from typing import Any, List, Literal, Optional, Dict
 from pydantic import BaseModel, Field
 
 class JobSections(BaseModel):
@@ -35,9 +35,56 @@ class Metadata(BaseModel):
     vector_dimension: int = 384
     sections_embedded: List[str]
     embedding_ready: bool
+    # job_id of the near-identical job whose vectors were reused
+    duplicate_of: Optional[str] = None
 
 class JobOutput(BaseModel):
     job_id: str
     cleaned_job: JobData
     embeddings: Embeddings
     metadata: Metadata
+
+class SearchRequest(BaseModel):
+    query: str
+    section: str = "description"
+    top_k: int = Field(default=10, ge=1, le=1000)
+    # "auto" uses the ANN index once one is trained for the section
+    mode: Literal["auto", "exact", "ann"] = "auto"
+    nprobe: Optional[int] = Field(default=None, ge=1)
+    # field -> accepted values, e.g. {"location": ["Pune", "Remote"]}
+    filters: Dict[str, List[str]] = Field(default_factory=dict)
+
+class SearchHit(BaseModel):
+    job_id: str
+    score: float
+    title: Optional[str] = None
+    location: Optional[str] = None
+
+class SearchResponse(BaseModel):
+    section: str
+    mode: str
+    total_jobs: int
+    took_ms: float
+    hits: List[SearchHit]
+
+class MatchRequest(BaseModel):
+    # Either a raw job / candidate profile (same field names as /process) or a stored job's id
+    job: Optional[Dict[str, Any]] = None
+    job_id: Optional[str] = None
+    # Per-section weights; sections left out use the MATCH_WEIGHTS default
+    weights: Dict[str, float] = Field(default_factory=dict)
+    filters: Dict[str, List[str]] = Field(default_factory=dict)
+    top_k: int = Field(default=10, ge=1, le=1000)
+
+class MatchHit(BaseModel):
+    job_id: str
+    score: float
+    sections: Dict[str, Optional[float]]
+    title: Optional[str] = None
+    location: Optional[str] = None
+
+class MatchResponse(BaseModel):
+    weights: Dict[str, float]
+    total_jobs: int
+    took_ms: float
+    hits: List[MatchHit]
@@ -0,0 +1,148 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "joined" embeds the comma-joined skills string; "composed" builds it from per-skill vectors
+SKILL_VECTOR_MODE = os.getenv("SKILL_VECTOR_MODE", "joined")
+# Optional .npz file the per-skill table is loaded from and saved to
+SKILL_VOCAB_PATH = os.getenv("SKILL_VOCAB_PATH")
+# Minimum seconds between saves of a grown table (it is also saved on close)
+SKILL_VOCAB_SAVE_INTERVAL_S = float(os.getenv("SKILL_VOCAB_SAVE_INTERVAL_S", "60"))
+
+def split_skills(text: str) -> List[str]:
+    # Feeds pack several skills into one item ("Python, MongoDB, Docker")
+    return [skill.strip() for skill in re.split(r'[,;|\n]', text) if skill.strip()]
+
+def skill_key(skill: str) -> str:
+    # bge-small-en-v1.5 is uncased, so case variants map to the same vector
+    return re.sub(r'\s+', ' ', skill).strip().casefold()
+
+class SkillVocabulary:
+    """
+    Incrementally grown table of per-skill vectors.
+
+    Vectors live in one contiguous float32 array with a string -> row index.
+    A skills section vector is the L2-normalized mean of its skills' rows,
+    so only skills never seen before need a model pass. The table is tied
+    to the model_id that produced it; a saved table from another model or
+    backend is not loaded.
+    """
+
+    def __init__(self, dim: int, model_id: str, path: Optional[str] = SKILL_VOCAB_PATH):
+        self.dim = dim
+        self.model_id = model_id
+        self.path = path
+        self.index: Dict[str, int] = {}
+        self._table = np.zeros((1024, dim), dtype=np.float32)
+        self._size = 0
+        self._lock = threading.Lock()
+        # Serializes writers of the .npz file; the table lock is only held to copy it
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+        self.encoded = 0
+        self.reused = 0
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def table(self) -> np.ndarray:
+        return self._table[:self._size]
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        needed = self._size + len(keys)
+        if needed > len(self._table):
+            grown = np.zeros((max(needed, 2 * len(self._table)), self.dim), dtype=np.float32)
+            grown[:self._size] = self._table[:self._size]
+            self._table = grown
+        self._table[self._size:needed] = vectors
+        for offset, key in enumerate(keys):
+            self.index[key] = self._size + offset
+        self._size = needed
+
+    def compose(self, skill_texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Returns one composed vector per skills text, encoding only unseen skills.
+        """
+        parsed = [split_skills(text) for text in skill_texts]
+        occurrences = sum(len(skills) for skills in parsed)
+
+        with self._lock:
+            unseen = {}
+            for skills in parsed:
+                for skill in skills:
+                    key = skill_key(skill)
+                    if key not in self.index and key not in unseen:
+                        unseen[key] = skill
+            self.reused += occurrences - len(unseen)
+
+        if unseen:
+            vectors = np.asarray(encode_fn(list(unseen.values())), dtype=np.float32)
+            with self._lock:
+                fresh = [(key, vector) for key, vector in zip(unseen, vectors) if key not in self.index]
+                if fresh:
+                    self._append([key for key, _ in fresh], np.stack([vector for _, vector in fresh]))
+                    self.encoded += len(fresh)
+                    self._dirty = True
+            if self.path and time.monotonic() - self._saved_at >= SKILL_VOCAB_SAVE_INTERVAL_S:
+                self.save(self.path)
+
+        composed = np.zeros((len(parsed), self.dim), dtype=np.float32)
+        with self._lock:
+            for i, skills in enumerate(parsed):
+                rows = [self.index[skill_key(skill)] for skill in skills]
+                if not rows:
+                    continue
+                mean = self._table[rows].mean(axis=0)
+                norm = np.linalg.norm(mean)
+                composed[i] = mean / norm if norm > 0 else mean
+        return composed
+
+    def save(self, path: str):
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                keys = np.array(sorted(self.index, key=self.index.get), dtype=str)
+                table = self.table.copy()
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(tmp_path, table=table, keys=keys, model_id=np.array(self.model_id))
+            os.replace(tmp_path, path)
+
+    def close(self):
+        if self.path:
+            self.save(self.path)
+
+    def load(self, path: str):
+        data = np.load(path)
+        model_id = str(data["model_id"]) if "model_id" in data else None
+        if model_id != self.model_id:
+            print(f"⚠️ Ignoring skill vectors in {path}: made by {model_id or 'an unknown model'}, not {self.model_id}")
+            return
+        keys = [str(key) for key in data["keys"]]
+        table = data["table"].astype(np.float32)
+        self._table = np.zeros((max(1024, len(keys)), self.dim), dtype=np.float32)
+        self._size = 0
+        self.index = {}
+        self._append(keys, table)
+        print(f"Loaded {len(keys)} skill vectors from {path}")
+
+    def stats(self) -> dict:
+        return {
+            "skills": self._size,
+            "encoded": self.encoded,
+            "reused": self.reused,
+        }
@@ -0,0 +1,125 @@
+import os
+from typing import Any, Dict, Optional
+import numpy as np
+from bson.binary import Binary
+from dotenv import load_dotenv
+from src.schemas import Embeddings, EmbeddingData
+from src.job_vectors import JobEmbeddings, SECTIONS
+
+load_dotenv()
+
+# How section vectors are stored in MongoDB:
+#   list    - BSON array of doubles (legacy, largest)
+#   float32 - packed little-endian float32 BinData (lossless for our vectors)
+#   int8    - per-vector scalar-quantized int8 BinData plus a float scale
+#   binary  - 1 bit per dimension (sign), for coarse Hamming prefiltering
+VECTOR_STORAGE_FORMAT = os.getenv("VECTOR_STORAGE_FORMAT", "list")
+# Keep the section text next to its vector (it is also available in cleaned_job)
+STORE_SECTION_TEXT = os.getenv("STORE_SECTION_TEXT", "1") == "1"
+
+VECTOR_FORMATS = ("list", "float32", "int8", "binary")
+
+def encode_vector(vector, fmt: str = VECTOR_STORAGE_FORMAT) -> Dict[str, Any]:
+    """
+    Returns the stored fields for one vector: "vector" plus, for packed
+    formats, "vector_format" and any parameters needed to decode it.
+    """
+    if fmt not in VECTOR_FORMATS:
+        raise ValueError(f"Unknown VECTOR_STORAGE_FORMAT '{fmt}'. Expected one of {VECTOR_FORMATS}.")
+
+    if fmt == "list":
+        if isinstance(vector, np.ndarray):
+            return {"vector": vector.tolist()}
+        return {"vector": [float(x) for x in vector]}
+
+    array = np.asarray(vector, dtype="<f4")
+
+    if fmt == "float32":
+        return {"vector": Binary(array.tobytes()), "vector_format": "float32"}
+
+    if fmt == "int8":
+        peak = float(np.abs(array).max())
+        scale = peak / 127 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(array / scale), -127, 127).astype(np.int8)
+        return {"vector": Binary(quantized.tobytes()), "vector_format": "int8", "vector_scale": scale}
+
+    return {"vector": Binary(np.packbits(array > 0).tobytes()), "vector_format": "binary", "vector_dim": int(array.shape[0])}
+
+def decode_section(section: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """
+    Decodes a stored section (any format) into a float32 vector, or None.
+    """
+    if not section or section.get("vector") is None:
+        return None
+
+    stored = section["vector"]
+    fmt = section.get("vector_format", "list")
+
+    if fmt == "list":
+        return np.asarray(stored, dtype=np.float32)
+    if fmt == "float32":
+        return np.frombuffer(bytes(stored), dtype="<f4").astype(np.float32)
+    if fmt == "int8":
+        return np.frombuffer(bytes(stored), dtype=np.int8).astype(np.float32) * np.float32(section["vector_scale"])
+    if fmt == "binary":
+        bits = np.unpackbits(np.frombuffer(bytes(stored), dtype=np.uint8))[:section["vector_dim"]]
+        # Signs only; scaled so the decoded vector is L2-normalized like the originals
+        return (bits.astype(np.float32) * 2 - 1) / np.sqrt(section["vector_dim"], dtype=np.float32)
+
+    raise ValueError(f"Unknown vector_format '{fmt}'")
+
+def encode_embeddings_document(embeddings: Dict[str, Dict[str, Any]], fmt: str = VECTOR_STORAGE_FORMAT, store_text: bool = STORE_SECTION_TEXT) -> Dict[str, Any]:
+    """
+    Converts a dumped Embeddings model (or a stored embeddings subdocument
+    in any format) into the configured storage format.
+    """
+    stored = {}
+    for section_name, section in embeddings.items():
+        section = section or {}
+        entry = {}
+        if store_text and section.get("text") is not None:
+            entry["text"] = section["text"]
+        if fmt == "list" and "vector_format" not in section:
+            # Already a plain list; skip the decode/encode round trip
+            entry["vector"] = section.get("vector")
+            stored[section_name] = entry
+            continue
+        vector = decode_section(section)
+        if vector is None:
+            entry["vector"] = None
+        else:
+            entry.update(encode_vector(vector, fmt))
+        stored[section_name] = entry
+    return stored
+
+def encode_job_embeddings(embeddings: JobEmbeddings, fmt: str = VECTOR_STORAGE_FORMAT, store_text: bool = STORE_SECTION_TEXT) -> Dict[str, Any]:
+    """
+    Stored embeddings subdocument straight from a JobEmbeddings, without
+    going through the Pydantic model; same layout as encode_embeddings_document.
+    """
+    stored = {}
+    for row, section_name in enumerate(SECTIONS):
+        entry = {}
+        if store_text and embeddings.texts[row] is not None:
+            entry["text"] = embeddings.texts[row]
+        if embeddings.present[row]:
+            entry.update(encode_vector(embeddings.matrix[row], fmt))
+        else:
+            entry["vector"] = None
+        stored[section_name] = entry
+    return stored
+
+def decode_embeddings(embeddings: Dict[str, Dict[str, Any]]) -> Embeddings:
+    """
+    Transparent decoder: rebuilds the Embeddings model from a stored
+    embeddings subdocument, whatever format its vectors were written in.
+    """
+    sections = {}
+    for section_name in Embeddings.model_fields:
+        section = embeddings.get(section_name) or {}
+        vector = decode_section(section)
+        sections[section_name] = EmbeddingData(
+            text=section.get("text"),
+            vector=vector.tolist() if vector is not None else None
+        )
+    return Embeddings(**sections)
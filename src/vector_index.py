@@ -0,0 +1,500 @@
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from src.embedder import SECTION_NAMES, VECTOR_DIMENSION
+from src.vector_codec import decode_section
+from src.ann import AnnIndexes, ANN_ENABLED
+
+load_dotenv()
+
+# Serve /search from an in-process snapshot of the stored vectors
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "1") == "1"
+# Directory holding the memory-mapped snapshot files (one per API process)
+SEARCH_SNAPSHOT_DIR = os.getenv("SEARCH_SNAPSHOT_DIR", "snapshot")
+# How often the snapshot pulls vectors written by other processes
+SEARCH_SYNC_INTERVAL_S = float(os.getenv("SEARCH_SYNC_INTERVAL_S", "5"))
+# Documents read per page while syncing
+SEARCH_SYNC_PAGE_SIZE = int(os.getenv("SEARCH_SYNC_PAGE_SIZE", "1000"))
+# How far behind the newest synced embedded_at each sync re-reads, to catch writes that commit late or come from skewed clocks
+SEARCH_SYNC_OVERLAP_S = float(os.getenv("SEARCH_SYNC_OVERLAP_S", "60"))
+# Default section weights for /match, as "section:weight" pairs
+MATCH_WEIGHTS = os.getenv(
+    "MATCH_WEIGHTS",
+    "title:0.2,required_skills:0.3,responsibilities:0.2,qualifications:0.1,description:0.2"
+)
+
+# cleaned_job fields kept per row next to the vectors
+ROW_FIELDS = ["title", "location", "employment_type", "experience_required"]
+
+# Row fields with an inverted index usable as /search and /match filters
+FILTER_FIELDS = ["location", "employment_type", "experience_required"]
+
+SnapshotRecord = Tuple[str, Dict[str, Optional[np.ndarray]], Dict[str, Any]]
+
+def filter_values(field: str, value: Any) -> List[str]:
+    """
+    Index keys for one field value: casefolded and whitespace-trimmed.
+    Locations are split on commas and slashes so "Pune, Mumbai" is found
+    by either city.
+    """
+    if not value:
+        return []
+    parts = re.split(r"[,/]", str(value)) if field == "location" else [str(value)]
+    return [key for key in (" ".join(part.split()).casefold() for part in parts) if key]
+
+class FieldIndex:
+    """
+    Inverted index value -> rows for FILTER_FIELDS, in snapshot row order.
+
+    Rows are kept in per-value sets and turned into sorted row arrays on
+    demand (cached until the value changes), so a filter becomes a set of
+    candidate rows before any vector is scored.
+    """
+
+    def __init__(self, fields: List[str] = FILTER_FIELDS):
+        self.fields = list(fields)
+        self.postings: Dict[str, Dict[str, set]] = {field: {} for field in self.fields}
+        self._arrays: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def _update(self, row: int, field: str, value: Any, add: bool):
+        for key in filter_values(field, value):
+            if add:
+                self.postings[field].setdefault(key, set()).add(row)
+            elif key in self.postings[field]:
+                self.postings[field][key].discard(row)
+                if not self.postings[field][key]:
+                    del self.postings[field][key]
+            self._arrays.pop((field, key), None)
+
+    def set_row(self, row: int, old_fields: Optional[Dict[str, Any]], new_fields: Dict[str, Any]):
+        for field in self.fields:
+            old_value = (old_fields or {}).get(field)
+            new_value = new_fields.get(field)
+            if old_value == new_value:
+                continue
+            self._update(row, field, old_value, add=False)
+            self._update(row, field, new_value, add=True)
+
+    def rows_for(self, field: str, key: str) -> np.ndarray:
+        cached = self._arrays.get((field, key))
+        if cached is None:
+            cached = np.array(sorted(self.postings[field].get(key, ())), dtype=np.int64)
+            self._arrays[(field, key)] = cached
+        return cached
+
+    def candidates(self, filters: Dict[str, List[str]]) -> np.ndarray:
+        """
+        Rows matching every filtered field (any of the values within a field).
+        """
+        result = None
+        for field, values in filters.items():
+            keys = {key for value in values for key in filter_values(field, value)}
+            rows = np.unique(np.concatenate([self.rows_for(field, key) for key in keys])) if keys else np.empty(0, dtype=np.int64)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result if result is not None else np.empty(0, dtype=np.int64)
+
+    def stats(self) -> dict:
+        return {field: len(values) for field, values in self.postings.items()}
+
+class VectorSnapshot:
+    """
+    Memory-mapped matrix snapshot of stored job vectors.
+
+    Every job owns one row, shared by all sections: `<section>.f32` holds
+    an L2-normalized float32 (capacity, dim) matrix per section and
+    `mask.u8` marks which sections a row actually has. Row -> job_id and
+    cleaned_job fields are appended to `rows.jsonl` (later lines win) and
+    `meta.json` records the row count and sync position. Files grow by
+    doubling, so rows never move.
+    """
+
+    def __init__(self, directory: str = SEARCH_SNAPSHOT_DIR, dim: int = VECTOR_DIMENSION, sections: List[str] = SECTION_NAMES):
+        self.directory = directory
+        self.dim = dim
+        self.sections = list(sections)
+        self.count = 0
+        self.capacity = 0
+        self.synced_until: Optional[datetime] = None
+        self.job_ids: List[Optional[str]] = []
+        self.fields: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.field_index = FieldIndex()
+        self.matrices: Dict[str, np.memmap] = {}
+        self.mask: Optional[np.memmap] = None
+        self._rows_file = None
+        # Objects with on_upsert(rows, vectors) / on_close() kept in step with the rows
+        self.listeners: List[Any] = []
+        # Searches run in worker threads while the event loop applies updates
+        self._lock = threading.RLock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _map(self, capacity: int):
+        for section in self.sections:
+            path = self._path(f"{section}.f32")
+            with open(path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+            self.matrices[section] = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+        path = self._path("mask.u8")
+        with open(path, "ab") as f:
+            f.truncate(capacity * len(self.sections))
+        self.mask = np.memmap(path, dtype=np.uint8, mode="r+", shape=(capacity, len(self.sections)))
+        self.capacity = capacity
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        for matrix in self.matrices.values():
+            matrix.flush()
+        self.mask.flush()
+        self.matrices = {}
+        self.mask = None
+        self._map(max(needed, 2 * self.capacity))
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = self._path("meta.json")
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim or meta["sections"] != self.sections:
+                raise ValueError(f"Snapshot in {self.directory} was built for a different layout; rebuild it.")
+            self.count = meta["count"]
+            self.synced_until = datetime.fromisoformat(meta["synced_until"]) if meta.get("synced_until") else None
+            self._map(meta["capacity"])
+
+            self.job_ids = [None] * self.count
+            self.fields = [{} for _ in range(self.count)]
+            with open(self._path("rows.jsonl")) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["row"] < self.count:
+                        self.job_ids[entry["row"]] = entry["job_id"]
+                        self.fields[entry["row"]] = entry["fields"]
+            self.rows = {job_id: row for row, job_id in enumerate(self.job_ids) if job_id is not None}
+            for row, fields in enumerate(self.fields):
+                self.field_index.set_row(row, None, fields)
+        else:
+            self._map(1024)
+
+        self._rows_file = open(self._path("rows.jsonl"), "a")
+        print(f"Opened search snapshot in {self.directory} ({self.count} jobs)")
+        return self
+
+    def close(self):
+        self.flush()
+        for listener in self.listeners:
+            listener.on_close()
+        if self._rows_file is not None:
+            self._rows_file.close()
+            self._rows_file = None
+
+    def flush(self):
+        with self._lock:
+            for matrix in self.matrices.values():
+                matrix.flush()
+            if self.mask is not None:
+                self.mask.flush()
+            if self._rows_file is not None:
+                self._rows_file.flush()
+            meta = {
+                "count": self.count,
+                "capacity": self.capacity,
+                "dim": self.dim,
+                "sections": self.sections,
+                "synced_until": self.synced_until.isoformat() if self.synced_until else None,
+            }
+            tmp_path = self._path("meta.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._path("meta.json"))
+
+    def _row_matches(self, row: int, vectors: Dict[str, Optional[np.ndarray]], fields: Dict[str, Any]) -> bool:
+        if self.fields[row] != fields:
+            return False
+        for column, section in enumerate(self.sections):
+            vector = vectors.get(section)
+            if vector is None or not self.mask[row, column]:
+                if vector is not None or self.mask[row, column]:
+                    return False
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if not np.allclose(self.matrices[section][row], vector / norm if norm > 0 else vector, atol=1e-6):
+                return False
+        return True
+
+    def upsert_many(self, records: Iterable[SnapshotRecord], skip_unchanged: bool = False) -> int:
+        """
+        Writes (job_id, {section: vector or None}, fields) records, reusing
+        the job's row if it is already in the snapshot. With skip_unchanged,
+        records identical to their row (e.g. this process's own writes
+        coming back through a sync) are not re-applied. Returns the number
+        of rows written.
+        """
+        with self._lock:
+            written_rows = []
+            written_vectors = {section: [] for section in self.sections}
+            for job_id, vectors, fields in records:
+                row = self.rows.get(job_id)
+                if row is not None and skip_unchanged and self._row_matches(row, vectors, fields):
+                    continue
+                if row is None:
+                    row = self.count
+                    self._grow(row + 1)
+                    self.count += 1
+                    self.job_ids.append(job_id)
+                    self.fields.append(fields)
+                    self.rows[job_id] = row
+                    self.field_index.set_row(row, None, fields)
+                else:
+                    self.field_index.set_row(row, self.fields[row], fields)
+                    self.fields[row] = fields
+
+                written_rows.append(row)
+                for column, section in enumerate(self.sections):
+                    vector = vectors.get(section)
+                    if vector is None:
+                        self.mask[row, column] = 0
+                        written_vectors[section].append(None)
+                        continue
+                    vector = np.asarray(vector, dtype=np.float32)
+                    norm = np.linalg.norm(vector)
+                    vector = vector / norm if norm > 0 else vector
+                    self.matrices[section][row] = vector
+                    self.mask[row, column] = 1
+                    written_vectors[section].append(vector)
+
+                self._rows_file.write(json.dumps({"row": row, "job_id": job_id, "fields": fields}) + "\n")
+
+            if written_rows:
+                for listener in self.listeners:
+                    listener.on_upsert(written_rows, written_vectors)
+            return len(written_rows)
+
+    def _candidate_rows(self, count: int, filters: Optional[Dict[str, List[str]]]) -> Optional[np.ndarray]:
+        # None means every row; call with the lock held
+        if not filters:
+            return None
+        rows = self.field_index.candidates(filters)
+        return rows[rows < count]
+
+    def search(self, query_vector: np.ndarray, section: str, top_k: int = 10, filters: Optional[Dict[str, List[str]]] = None) -> List[Tuple[int, float]]:
+        """
+        Exact cosine top-k over one section. Returns (row, score) pairs,
+        best first, skipping rows without that section. With filters only
+        the rows the field index returns are scored.
+        """
+        with self._lock:
+            count = self.count
+            matrix = self.matrices[section]
+            column = self.sections.index(section)
+            rows = self._candidate_rows(count, filters)
+            present = self.mask[:count, column] if rows is None else self.mask[rows, column]
+
+        if count == 0 or (rows is not None and len(rows) == 0):
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        scores = (matrix[:count] if rows is None else matrix[rows]) @ query
+        scores[present == 0] = -np.inf
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(i if rows is None else rows[i]), float(scores[i]))
+            for i in top if np.isfinite(scores[i])
+        ]
+
+    def row_vectors(self, row: int) -> Dict[str, np.ndarray]:
+        with self._lock:
+            return {
+                section: np.array(self.matrices[section][row])
+                for column, section in enumerate(self.sections)
+                if self.mask[row, column]
+            }
+
+    def match(self, query_vectors: Dict[str, np.ndarray], weights: Dict[str, float], top_k: int = 10, exclude_row: Optional[int] = None, filters: Optional[Dict[str, List[str]]] = None) -> List[Tuple[int, float, Dict[str, Optional[float]]]]:
+        """
+        Weighted multi-section match. Each query section is scored against
+        every row (or every filtered row) with one matrix-vector product;
+        scores are fused per row with the weights of the sections that row
+        actually has, so a job missing a section is ranked on the rest
+        instead of being dropped. Returns (row, score, {section: score or
+        None}) triples, best first.
+        """
+        sections = [section for section in self.sections if query_vectors.get(section) is not None and weights.get(section, 0) > 0]
+        with self._lock:
+            count = self.count
+            matrices = [self.matrices[section] for section in sections]
+            columns = [self.sections.index(section) for section in sections]
+            rows = self._candidate_rows(count, filters)
+            present = (self.mask[:count] if rows is None else self.mask[rows])[:, columns].astype(bool)
+
+        if count == 0 or not sections or (rows is not None and len(rows) == 0):
+            return []
+        if rows is None:
+            rows = np.arange(count)
+
+        # (candidates, n_sections) similarity matrix
+        scores = np.empty((len(rows), len(sections)), dtype=np.float32)
+        for column, (section, matrix) in enumerate(zip(sections, matrices)):
+            query = np.asarray(query_vectors[section], dtype=np.float32)
+            vectors = matrix[:count] if len(rows) == count else matrix[rows]
+            scores[:, column] = vectors @ (query / (np.linalg.norm(query) or 1.0))
+
+        row_weights = np.where(present, np.array([weights[section] for section in sections], dtype=np.float32), 0)
+        total_weight = row_weights.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fused = (scores * row_weights).sum(axis=1) / total_weight
+        fused[total_weight == 0] = -np.inf
+        if exclude_row is not None:
+            fused[rows == exclude_row] = -np.inf
+
+        k = min(top_k, len(rows))
+        top = np.argpartition(-fused, k - 1)[:k]
+        top = top[np.argsort(-fused[top])]
+        return [
+            (
+                int(rows[i]),
+                float(fused[i]),
+                {section: float(scores[i, column]) if present[i, column] else None for column, section in enumerate(sections)}
+            )
+            for i in top if np.isfinite(fused[i])
+        ]
+
+def parse_weights(text: str) -> Dict[str, float]:
+    weights = {}
+    for pair in text.split(","):
+        if pair.strip():
+            section, weight = pair.split(":")
+            weights[section.strip()] = float(weight)
+    return weights
+
+def record_from_document(doc: Dict[str, Any]) -> SnapshotRecord:
+    job_id = doc.get("job_id") or str(doc["_id"])
+    embeddings = doc.get("embeddings") or {}
+    vectors = {section: decode_section(embeddings.get(section)) for section in SECTION_NAMES}
+    cleaned_job = doc.get("cleaned_job") or {}
+    fields = {name: cleaned_job.get(name) for name in ROW_FIELDS}
+    return job_id, vectors, fields
+
+def record_from_output(job_id: str, embeddings, cleaned_job) -> SnapshotRecord:
+    vectors = {section: embeddings.vector(section) for section in SECTION_NAMES}
+    fields = {name: getattr(cleaned_job, name) for name in ROW_FIELDS}
+    return job_id, vectors, fields
+
+SYNC_PROJECTION = {
+    "job_id": 1,
+    "embeddings": 1,
+    "embedded_at": 1,
+    **{f"cleaned_job.{name}": 1 for name in ROW_FIELDS},
+}
+
+def as_utc(value: datetime) -> datetime:
+    # Motor returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+async def sync_snapshot(snapshot: VectorSnapshot, collection) -> int:
+    """
+    Pulls vectors written since the last sync (by any process) into the
+    snapshot. An empty snapshot is filled from every embedded job in _id
+    order; after that documents are read in (embedded_at, _id) order from
+    SEARCH_SYNC_OVERLAP_S before the newest embedded_at already synced.
+    embedded_at is stamped by the writer before its write commits, so the
+    overlap picks up documents that became visible after a later-stamped
+    one; rows that are already current are skipped.
+    """
+    synced = 0
+    if snapshot.synced_until is None:
+        started = datetime.now(timezone.utc)
+        after_id = None
+        while True:
+            query = {"metadata.embedding_ready": True}
+            if after_id is not None:
+                query["_id"] = {"$gt": after_id}
+            cursor = collection.find(query, SYNC_PROJECTION).sort("_id", 1).limit(SEARCH_SYNC_PAGE_SIZE)
+            docs = await cursor.to_list(length=SEARCH_SYNC_PAGE_SIZE)
+            if not docs:
+                break
+            snapshot.upsert_many(record_from_document(doc) for doc in docs)
+            synced += len(docs)
+            after_id = docs[-1]["_id"]
+            print(f"[Search] Loaded {synced} jobs into snapshot...")
+        snapshot.synced_until = started
+    else:
+        newest = as_utc(snapshot.synced_until)
+        query = {"embedded_at": {"$gt": newest - timedelta(seconds=SEARCH_SYNC_OVERLAP_S)}}
+        while True:
+            cursor = collection.find(query, SYNC_PROJECTION).sort([("embedded_at", 1), ("_id", 1)]).limit(SEARCH_SYNC_PAGE_SIZE)
+            docs = await cursor.to_list(length=SEARCH_SYNC_PAGE_SIZE)
+            if not docs:
+                break
+            # Documents already applied (including this process's own saves) are not re-applied
+            synced += snapshot.upsert_many((record_from_document(doc) for doc in docs), skip_unchanged=True)
+            last_at, last_id = docs[-1]["embedded_at"], docs[-1]["_id"]
+            newest = max(newest, as_utc(last_at))
+            if len(docs) < SEARCH_SYNC_PAGE_SIZE:
+                break
+            # Page on (embedded_at, _id) so equal timestamps at a page boundary are not skipped
+            query = {"$or": [
+                {"embedded_at": {"$gt": last_at}},
+                {"embedded_at": last_at, "_id": {"$gt": last_id}}
+            ]}
+        # A writer whose clock runs ahead must not push the window past other writers' documents
+        snapshot.synced_until = min(newest, datetime.now(timezone.utc))
+
+    if synced:
+        snapshot.flush()
+    return synced
+
+def reset_snapshot(directory: str = SEARCH_SNAPSHOT_DIR):
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+
+_SNAPSHOT: Optional[VectorSnapshot] = None
+_ANN: Optional[AnnIndexes] = None
+
+def get_snapshot() -> Optional[VectorSnapshot]:
+    return _SNAPSHOT
+
+def get_ann_indexes() -> Optional[AnnIndexes]:
+    return _ANN
+
+def open_snapshot(directory: str = SEARCH_SNAPSHOT_DIR) -> VectorSnapshot:
+    global _SNAPSHOT, _ANN
+    if _SNAPSHOT is None:
+        _SNAPSHOT = VectorSnapshot(directory).open()
+        if ANN_ENABLED:
+            _ANN = AnnIndexes(_SNAPSHOT)
+            _SNAPSHOT.listeners.append(_ANN)
+    return _SNAPSHOT
+
+def close_snapshot():
+    global _SNAPSHOT, _ANN
+    if _SNAPSHOT is not None:
+        _SNAPSHOT.close()
+        _SNAPSHOT = None
+        _ANN = None
+
+def add_to_snapshot(records: List[SnapshotRecord]):
+    """
+    Applies freshly written vectors to this process's snapshot right away,
+    ahead of the next sync. Does nothing when no snapshot is open.
+    """
+    if _SNAPSHOT is not None and records:
+        _SNAPSHOT.upsert_many(records)
@@ -1,77 +1,335 @@
 import asyncio
-from src.database import db, COLLECTION_NAME
-from src.normalizer import normalize_job
-from src.embedder import generate_embeddings, get_metadata
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+from src import database
+from src.database import (
+    COLLECTION_NAME, EMBEDDING_PENDING, EMBEDDING_PROCESSING, EMBEDDING_DONE, EMBEDDING_FAILED
+)
+from src.normalizer import normalize_jobs
+from src.embedder import generate_embeddings_batch, get_metadata
+from src.dedup import embed_deduplicated
+from src.inference import run_inference
+from src.vector_codec import encode_job_embeddings
+from src.vector_index import add_to_snapshot, record_from_output
+
+load_dotenv()
+
+# Documents claimed, embedded and written per pipeline step
+WATCHER_PAGE_SIZE = int(os.getenv("WATCHER_PAGE_SIZE", "64"))
+# Pause after a partial page, and the ceiling the idle backoff grows to
+WATCHER_MIN_SLEEP_S = float(os.getenv("WATCHER_MIN_SLEEP_S", "0.5"))
+WATCHER_MAX_SLEEP_S = float(os.getenv("WATCHER_MAX_SLEEP_S", "30"))
+# How long a claimed document is reserved for this replica before others may take it over
+WATCHER_LEASE_S = float(os.getenv("WATCHER_LEASE_S", "300"))
+# Claims per document before it is marked failed instead of retried
+WATCHER_MAX_ATTEMPTS = int(os.getenv("WATCHER_MAX_ATTEMPTS", "5"))
+# Identifies this replica in lease records
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Documents read per page when enqueueing jobs inserted without an embedding_state
+WATCHER_ENQUEUE_PAGE_SIZE = int(os.getenv("WATCHER_ENQUEUE_PAGE_SIZE", "1000"))
+# How far behind the last scanned _id each enqueue sweep restarts, for writers with skewed clocks
+WATCHER_ENQUEUE_LOOKBACK_S = float(os.getenv("WATCHER_ENQUEUE_LOOKBACK_S", "60"))
+# Collection holding the enqueue sweep's persisted _id high-water mark
+WATCHER_STATE_COLLECTION = os.getenv("DB_WATCHER_STATE_COLLECTION", "watcher_state")
+
+# Everything normalize_job may read (it matches raw keys loosely, so no include list),
+# minus the fields this service writes, like stored vectors
+PROJECTION = {"embeddings": 0, "cleaned_job": 0, "metadata": 0}
+
+def claimable_filter(now: datetime) -> dict:
+    # Only queued jobs carry embedding_enqueued_at, so this runs on the partial
+    # "embedding_queue" index and costs grow with the backlog, not the collection.
+    # A job is claimable when it is pending or its holder's lease has expired.
+    return {
+        "embedding_enqueued_at": {"$exists": True},
+        "embedding_claim.attempts": {"$not": {"$gte": WATCHER_MAX_ATTEMPTS}},
+        "$or": [
+            {"embedding_state": EMBEDDING_PENDING},
+            {"embedding_state": EMBEDDING_PROCESSING, "embedding_claim.expires_at": {"$lt": now}}
+        ]
+    }
+
+async def enqueue_new_jobs(collection):
+    """
+    Gives an embedding_state to jobs inserted by other apps without one.
+
+    Walks the collection's ObjectId _ids in order from a persisted
+    high-water mark, so each sweep only reads documents inserted since the
+    previous one (plus a short lookback for writers whose clocks run
+    behind). Jobs that are already embedded become done; the rest are
+    queued as pending. _ids of other types (strings, numbers) say nothing
+    about insertion order, so documents keyed that way are not swept and
+    must be written with an embedding_state (save_job does).
+    """
+    state_collection = database.db[WATCHER_STATE_COLLECTION]
+    state = await state_collection.find_one({"_id": "enqueue_scan"})
+    if state and not isinstance(state.get("last_id"), ObjectId):
+        state = None
+
+    after_id = None
+    if state:
+        lookback_from = state["last_id"].generation_time - timedelta(seconds=WATCHER_ENQUEUE_LOOKBACK_S)
+        after_id = ObjectId.from_datetime(lookback_from)
+
+    enqueued = 0
+    while True:
+        # $gt with an ObjectId only matches ObjectIds, like the $type filter of the first sweep
+        query = {"_id": {"$gt": after_id}} if after_id is not None else {"_id": {"$type": "objectId"}}
+        cursor = collection.find(query, {"embedding_state": 1, "metadata.embedding_ready": 1}).sort("_id", 1).limit(WATCHER_ENQUEUE_PAGE_SIZE)
+        docs = await cursor.to_list(length=WATCHER_ENQUEUE_PAGE_SIZE)
+        if not docs:
+            break
+
+        unstated = [doc for doc in docs if "embedding_state" not in doc]
+        ready_ids = [doc["_id"] for doc in unstated if doc.get("metadata", {}).get("embedding_ready") is True]
+        pending_ids = [doc["_id"] for doc in unstated if doc.get("metadata", {}).get("embedding_ready") is not True]
+
+        if ready_ids:
+            await collection.update_many(
+                {"_id": {"$in": ready_ids}, "embedding_state": {"$exists": False}},
+                {"$set": {"embedding_state": EMBEDDING_DONE}}
+            )
+        if pending_ids:
+            result = await collection.update_many(
+                {"_id": {"$in": pending_ids}, "embedding_state": {"$exists": False}},
+                {"$set": {"embedding_state": EMBEDDING_PENDING, "embedding_enqueued_at": datetime.now(timezone.utc)}}
+            )
+            enqueued += result.modified_count
+
+        after_id = docs[-1]["_id"]
+        if state is None or after_id > state["last_id"]:
+            state = {"_id": "enqueue_scan", "last_id": after_id}
+            await state_collection.replace_one({"_id": "enqueue_scan"}, state, upsert=True)
+
+        if len(docs) < WATCHER_ENQUEUE_PAGE_SIZE:
+            break
+
+    if enqueued:
+        print(f"📥 [Watcher] Queued {enqueued} new jobs for embedding")
+    return enqueued
+
+async def claim_page(collection):
+    """
+    Atomically reserves up to WATCHER_PAGE_SIZE queued jobs for this replica,
+    oldest first.
+
+    Candidate IDs are read first, then claimed with one update_many that
+    re-checks claimability, so two replicas racing for the same document
+    cannot both win it. The page is whatever carries this claim's token.
+    """
+    now = datetime.now(timezone.utc)
+    cursor = collection.find(claimable_filter(now), {"_id": 1}).sort("embedding_enqueued_at", 1).limit(WATCHER_PAGE_SIZE)
+    candidates = await cursor.to_list(length=WATCHER_PAGE_SIZE)
+    if not candidates:
+        return []
+
+    token = uuid.uuid4().hex
+    candidate_ids = [doc["_id"] for doc in candidates]
+    await collection.update_many(
+        {"_id": {"$in": candidate_ids}, **claimable_filter(now)},
+        {
+            "$set": {
+                "embedding_state": EMBEDDING_PROCESSING,
+                "embedding_claim.worker": WORKER_ID,
+                "embedding_claim.token": token,
+                "embedding_claim.expires_at": now + timedelta(seconds=WATCHER_LEASE_S)
+            },
+            "$inc": {"embedding_claim.attempts": 1}
+        }
+    )
+    # The _id list keeps this on the _id index; the token picks the ones we won
+    cursor = collection.find({"_id": {"$in": candidate_ids}, "embedding_claim.token": token}, PROJECTION)
+    page = await cursor.to_list(length=WATCHER_PAGE_SIZE)
+    for raw_doc in page:
+        raw_doc["_claim_token"] = token
+    return page
+
+def release_operation(raw_doc, error: Exception) -> UpdateOne:
+    """
+    Gives a failed job back to the queue right away, or marks it failed
+    once it has used up its attempts.
+    """
+    attempts = raw_doc.get("embedding_claim", {}).get("attempts", 0)
+    update = {
+        "$set": {
+            "embedding_state": EMBEDDING_PENDING,
+            "embedding_claim.expires_at": datetime.now(timezone.utc),
+            "embedding_claim.last_error": str(error)
+        }
+    }
+    if attempts >= WATCHER_MAX_ATTEMPTS:
+        update["$set"]["embedding_state"] = EMBEDDING_FAILED
+        update["$unset"] = {"embedding_enqueued_at": ""}
+        print(f"🅿️ [Watcher] Parking job {raw_doc['_id']} after {attempts} attempts: {error}")
+    return UpdateOne({"_id": raw_doc["_id"], "embedding_claim.token": raw_doc["_claim_token"]}, update)
+
+async def park_exhausted(collection):
+    # Jobs whose last allowed lease expired without a result (e.g. the replica died)
+    result = await collection.update_many(
+        {
+            "embedding_enqueued_at": {"$exists": True},
+            "embedding_state": EMBEDDING_PROCESSING,
+            "embedding_claim.attempts": {"$gte": WATCHER_MAX_ATTEMPTS},
+            "embedding_claim.expires_at": {"$lt": datetime.now(timezone.utc)}
+        },
+        {"$set": {"embedding_state": EMBEDDING_FAILED}, "$unset": {"embedding_enqueued_at": ""}}
+    )
+    if result.modified_count:
+        print(f"🅿️ [Watcher] Parked {result.modified_count} jobs with expired final leases")
+
+async def embed_page(page):
+    """
+    Normalizes a page of claimed documents and embeds all of them in one batch.
+    Returns the update operations for the page, including releases for
+    failures, and the search snapshot records of the embedded jobs.
+    """
+    normalized = []
+    operations = []
+    records = []
+    # Fallback for ID
+    job_ids = [raw_doc.get("job_id") or str(raw_doc.get("_id")) for raw_doc in page]
+
+    # We map your app's raw fields to our canonical schema
+    for raw_doc, canonical_job in zip(page, normalize_jobs(page, job_ids)):
+        if isinstance(canonical_job, Exception):
+            print(f"⚠️ [Watcher] Failed to normalize job {raw_doc.get('_id')}: {canonical_job}")
+            operations.append(release_operation(raw_doc, canonical_job))
+        else:
+            normalized.append((raw_doc, canonical_job))
+
+    if not normalized:
+        return operations, records
+
+    # Runs on the inference executor so the event loop keeps claiming and flushing
+    try:
+        page_embeddings = await embed_deduplicated(
+            [canonical_job for _, canonical_job in normalized],
+            lambda jobs: run_inference(generate_embeddings_batch, jobs)
+        )
+    except Exception as batch_e:
+        print(f"⚠️ [Watcher] Failed to embed batch of {len(normalized)} jobs: {batch_e}")
+        return operations + [release_operation(raw_doc, batch_e) for raw_doc, _ in normalized], records
+
+    for (raw_doc, canonical_job), (embeddings, duplicate_of) in zip(normalized, page_embeddings):
+        metadata = get_metadata(embeddings, duplicate_of)
+
+        # We add 'embeddings', 'metadata', and 'cleaned_job' fields.
+        # We preserve all other original fields in the document.
+        update_payload = {
+            "embeddings": encode_job_embeddings(embeddings),
+            "metadata": metadata.model_dump(),
+            "cleaned_job": canonical_job.job_data.model_dump(),
+            "embedded_at": datetime.now(timezone.utc)
+        }
+        # Only write if we still hold the lease; a replica that took the job over owns it now
+        operations.append(UpdateOne(
+            {"_id": raw_doc["_id"], "embedding_claim.token": raw_doc["_claim_token"]},
+            {
+                "$set": {**update_payload, "embedding_state": EMBEDDING_DONE},
+                "$unset": {"embedding_claim": "", "embedding_enqueued_at": ""}
+            }
+        ))
+        records.append(record_from_output(canonical_job.job_id, embeddings, canonical_job.job_data))
+
+    return operations, records
+
+async def flush(collection, operations, records):
+    if not operations:
+        return
+    try:
+        result = await collection.bulk_write(operations, ordered=False)
+        print(f"✅ [Watcher] Wrote {result.modified_count} job updates")
+        add_to_snapshot(records)
+    except BulkWriteError as e:
+        details = e.details or {}
+        print(f"⚠️ [Watcher] Bulk write finished with {len(details.get('writeErrors', []))} errors ({details.get('nModified', 0)} jobs updated)")
 
 async def watch_and_embed():
     """
-    Background task that polls the database for jobs without embeddings.
-    It generates embeddings and updates the document in place.
+    Background task that claims jobs without embeddings from the database.
+    It generates embeddings and updates the documents in place.
+
+    Jobs move through embedding_state pending -> processing -> done/failed
+    and are taken oldest first from the indexed queue. New documents that
+    arrive without a state are queued by a sweep whenever the backlog runs
+    dry. Jobs are claimed with a lease (worker ID, expiry, attempt counter),
+    so several replicas can drain the same backlog without embedding a job
+    twice. Leases of crashed replicas expire and are claimed again; jobs
+    that fail WATCHER_MAX_ATTEMPTS times are marked failed.
+
+    Three stages overlap: while page N is being encoded, page N+1 is
+    claimed and the writes for page N-1 are flushed as one unordered
+    bulk_write. Sleep adapts to the backlog: none while pages come back
+    full, a short pause after a partial page and exponential backoff while
+    idle.
     """
-    print("Starting Background Watcher (Polling Mode)...")
-    
+    print(f"Starting Background Watcher (Pipelined Mode, worker {WORKER_ID})...")
+
+    next_page = None
+    pending_flush = None
+    idle_sleep = WATCHER_MIN_SLEEP_S
+
     while True:
         try:
             # Wait for DB connection
-            if db is None:
+            if database.db is None:
                 await asyncio.sleep(2)
                 continue
 
-            collection = db[COLLECTION_NAME]
-            
-            # CRITICAL: Find jobs where embedding is NOT ready.
-            # This handles new inserts AND ensures we don't re-process finished jobs.
-            cursor = collection.find(
-                {"metadata.embedding_ready": {"$ne": True}}
-            ).limit(10)  # Process in small batches
-            
-            processed_count = 0
-            
-            async for raw_doc in cursor:
-                try:
-                    # Fallback for ID
-                    job_id = raw_doc.get("job_id")
-                    if not job_id:
-                        job_id = str(raw_doc.get("_id"))
-
-                    # 1. Normalize
-                    # We map your app's raw fields to our canonical schema
-                    canonical_job = normalize_job(raw_doc, job_id)
-                    
-                    # 2. Embed
-                    embeddings = generate_embeddings(canonical_job.job_data)
-                    
-                    # 3. Metadata
-                    metadata = get_metadata(embeddings)
-                    
-                    # 4. Update In-Place
-                    # We add 'embeddings', 'metadata', and 'cleaned_job' fields.
-                    # We preserve all other original fields in the document.
-                    update_payload = {
-                        "embeddings": embeddings.model_dump(),
-                        "metadata": metadata.model_dump(),
-                        "cleaned_job": canonical_job.job_data.model_dump()
-                    }
-                    
-                    # Only if we successfully generated embeddings do we set them
-                    await collection.update_one(
-                        {"_id": raw_doc["_id"]},
-                        {"$set": update_payload}
-                    )
-                    
-                    processed_count += 1
-                    print(f"✅ [Watcher] Embedded Job ID: {job_id}")
-
-                except Exception as inner_e:
-                    print(f"⚠️ [Watcher] Failed to process job {raw_doc.get('_id')}: {inner_e}")
-            
-            if processed_count == 0:
-                # If no work found, sleep longer (5 seconds)
-                await asyncio.sleep(5)
+            collection = database.db[COLLECTION_NAME]
+
+            if next_page is None:
+                next_page = asyncio.create_task(claim_page(collection))
+            page = await next_page
+            next_page = None
+
+            full_page = len(page) == WATCHER_PAGE_SIZE
+            if full_page:
+                # Stage 1: claim the next page while this one is encoded
+                next_page = asyncio.create_task(claim_page(collection))
+
+            if page:
+                # Stage 2: encode the current page (the previous flush runs meanwhile)
+                operations, records = await embed_page(page)
+
+                # Stage 3: flush this page in the background
+                if pending_flush is not None:
+                    await pending_flush
+                pending_flush = asyncio.create_task(flush(collection, operations, records))
+
+            if full_page:
+                idle_sleep = WATCHER_MIN_SLEEP_S
+                continue
+
+            if pending_flush is not None:
+                await pending_flush
+                pending_flush = None
+
+            # Queue anything inserted since the last sweep before polling again
+            if await enqueue_new_jobs(collection):
+                idle_sleep = WATCHER_MIN_SLEEP_S
+                continue
+
+            if page:
+                idle_sleep = WATCHER_MIN_SLEEP_S
+                await asyncio.sleep(WATCHER_MIN_SLEEP_S)
             else:
-                # If we did work, sleep briefly (1 second) to process queue faster
-                await asyncio.sleep(1)
+                await park_exhausted(collection)
+                await asyncio.sleep(idle_sleep)
+                idle_sleep = min(idle_sleep * 2, WATCHER_MAX_SLEEP_S)
 
         except Exception as e:
             print(f"❌ [Watcher] Error: {e}")
+            if next_page is not None:
+                next_page.cancel()
+                next_page = None
+            if pending_flush is not None:
+                await asyncio.gather(pending_flush, return_exceptions=True)
+                pending_flush = None
             await asyncio.sleep(10)
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+from typing import Any, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upserts coalesced into one bulk_write (1 writes each upsert directly)
+WRITE_BUFFER_MAX_SIZE = int(os.getenv("WRITE_BUFFER_MAX_SIZE", "100"))
+# Maximum time the first buffered upsert waits for others to join
+WRITE_BUFFER_MAX_WAIT_MS = float(os.getenv("WRITE_BUFFER_MAX_WAIT_MS", "10"))
+
+class WriteBehindBuffer:
+    """
+    Group-commit writer for upserts.
+
+    Callers submit an UpdateOne and await a future. A background task
+    gathers whatever arrives within max_wait_ms (up to max_size operations),
+    sends it as one unordered bulk_write and resolves each caller's future
+    with its own upserted _id (None when an existing document was updated)
+    or its own write error. When the same key is written twice in one
+    group only the latest write is sent, since unordered bulk writes do not
+    guarantee which would land last.
+    """
+
+    def __init__(self, max_size: int = WRITE_BUFFER_MAX_SIZE, max_wait_ms: float = WRITE_BUFFER_MAX_WAIT_MS):
+        self.max_size = max_size
+        self.max_wait_ms = max_wait_ms
+        self._collection = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushes = 0
+        self.operations = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def start(self, collection):
+        if self._task is None:
+            self._collection = collection
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Flush everything already submitted before shutting down
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, key: Any, operation: UpdateOne):
+        if self._task is None:
+            raise RuntimeError("Write buffer not started. Call start() first.")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, operation, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        first = await self._queue.get()
+        group = [first]
+        deadline = first[3] + self.max_wait_ms / 1000
+
+        while len(group) < self.max_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            group.append(item)
+
+        return group
+
+    async def _run(self):
+        while True:
+            group = await self._collect()
+            try:
+                await self._flush(group)
+            finally:
+                for _ in group:
+                    self._queue.task_done()
+
+    async def _flush(self, group):
+        # Latest write per key wins; earlier writers share its outcome
+        latest = {}
+        for key, operation, future, _ in group:
+            latest[key] = operation
+        keys = list(latest)
+        waiters = {key: [] for key in keys}
+        for key, _, future, _ in group:
+            waiters[key].append(future)
+
+        self.flushes += 1
+        self.operations += len(keys)
+        self.coalesced += len(group) - len(keys)
+
+        upserted_ids = {}
+        failures = {}
+        try:
+            result = await self._collection.bulk_write([latest[key] for key in keys], ordered=False)
+            upserted_ids = result.upserted_ids or {}
+        except BulkWriteError as e:
+            details = e.details or {}
+            upserted_ids = {item["index"]: item["_id"] for item in details.get("upserted", [])}
+            for error in details.get("writeErrors", []):
+                failures[error["index"]] = WriteError(error.get("errmsg"), error.get("code"), error)
+        except Exception as e:
+            self.errors += len(keys)
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        self.errors += len(failures)
+        for index, key in enumerate(keys):
+            for future in waiters[key]:
+                if future.done():
+                    continue
+                if index in failures:
+                    future.set_exception(failures[index])
+                else:
+                    future.set_result(upserted_ids.get(index))
+
+    def stats(self) -> dict:
+        return {
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait_ms,
+            "flushes": self.flushes,
+            "operations": self.operations,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "avg_flush_size": self.operations / self.flushes if self.flushes else 0.0,
+        }
+
+write_buffer = WriteBehindBuffer()
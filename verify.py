@@ -30,12 +30,12 @@ def verify():
     embeddings = generate_embeddings(canonical_job.job_data)
     
     # Check vectors
-    if embeddings.title.vector:
+    if embeddings.title.vector is not None:
         print(f"Title Vector Dimension: {len(embeddings.title.vector)}")
     else:
         print("Error: Title vector missing")
         
-    if embeddings.required_skills.vector:
+    if embeddings.required_skills.vector is not None:
         print(f"Skills Vector Dimension: {len(embeddings.required_skills.vector)}")
         
     # 3. Metadata
@@ -45,7 +45,7 @@ def verify():
     output = JobOutput(
         job_id=canonical_job.job_id,
         cleaned_job=canonical_job.job_data,
-        embeddings=embeddings,
+        embeddings=embeddings.to_model(),
         metadata=metadata
     )
     
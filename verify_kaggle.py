@@ -57,7 +57,7 @@ def verify_kaggle():
         output = JobOutput(
             job_id=canonical_job.job_id,
             cleaned_job=canonical_job.job_data,
-            embeddings=embeddings,
+            embeddings=embeddings.to_model(),
             metadata=metadata
         )
         